@@ -0,0 +1,263 @@
+"""Headless batch mode: run a list of questions over a directory of files.
+
+Uses the same loading, prompt-building and chart-spec parsing as the
+Streamlit app (via insight.py) without importing Streamlit. Questions run
+concurrently on a thread pool with a shared rate limit and retry/backoff, and
+each answer is written as one JSON line with its chart spec and timings.
+
+Example:
+    python batch.py data/ --questions questions.txt --output batch_results.jsonl --concurrency 8 --rate 4
+    python batch.py data/ --questions questions.txt --model stub --stub-latency 0.5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from insight import (
+    GEMINI_MODEL_NAME,
+    PROMPT_TEMPLATE_VERSION,
+    SUPPORTED_EXTENSIONS,
+    build_document_state,
+    build_insight_prompt,
+    extract_chart_json,
+    format_computed_results,
+    load_document,
+    run_query_plan,
+    select_llm_data,
+    strip_chart_json,
+)
+from query_plan import QueryPlanError
+from response_cache import ResponseCache, file_digest, make_cache_key
+from stub_model import StubModel
+
+
+class RateLimiter:
+    """A thread-safe limiter spacing calls at most `rate` per second (0 disables it)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def call_with_retry(func, retries, backoff, max_backoff=30.0):
+    """Calls func, retrying failures with exponential backoff and jitter.
+
+    Returns (result, attempts). The last exception is re-raised once the
+    retries are exhausted.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(), attempt + 1
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def load_questions(path):
+    """Reads questions from a JSON list or a text file with one question per line."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return [str(question) for question in json.load(f)]
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def discover_files(directory):
+    """Returns the supported files in directory, sorted by name."""
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+def create_model(name, stub_latency=0.0):
+    """Returns the stub model or a configured Gemini model."""
+    if name == "stub":
+        return StubModel(latency=stub_latency)
+    import google.generativeai as genai
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise SystemExit("Gemini API Key not found. Please set it in your .env file or use --model stub.")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
+
+
+def load_file(path, cache_dir):
+    """Loads one file and its per-document state, recording how long it took."""
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    extension = os.path.splitext(path)[1].lower()
+    digest = file_digest(data)
+    df = load_document(data, extension, digest, os.path.join(cache_dir, "frames"))
+    document = {"path": path, "extension": extension, "digest": digest, "df": df}
+    document.update(build_document_state(df, extension))
+    document["load_seconds"] = time.perf_counter() - start
+    return document
+
+
+class BatchRunner:
+    """Answers questions against loaded documents with shared rate limiting and retries."""
+
+    def __init__(self, model, model_name, limiter, retries=3, backoff=1.0, response_cache=None):
+        self.model = model
+        self.model_name = model_name
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.response_cache = response_cache
+
+    def _generate(self, document, prompt, payload, question, stats):
+        if self.response_cache is not None:
+            key = make_cache_key(document["digest"], PROMPT_TEMPLATE_VERSION, payload, question, self.model_name)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                stats["cache_hits"] += 1
+                return cached
+
+        def call():
+            self.limiter.acquire()
+            return self.model.generate_content(prompt).text
+
+        text, attempts = call_with_retry(call, self.retries, self.backoff)
+        stats["attempts"] += attempts
+        if self.response_cache is not None:
+            self.response_cache.set(key, text)
+        return text
+
+    def answer(self, document, question):
+        """Runs the full question pipeline and returns the JSONL record."""
+        df = document["df"]
+        extension = document["extension"]
+        stats = {"attempts": 0, "cache_hits": 0}
+        record = {"file": document["path"], "question": question}
+        timing = {"load_seconds": round(document["load_seconds"], 4)}
+        start = time.perf_counter()
+        try:
+            data_for_llm, data_format_desc = select_llm_data(
+                df, extension, question, document["pdf_index"], document["profile_text"], document["pdf_tables"]
+            )
+            computed_results = ""
+            if extension != '.pdf':
+                plan_start = time.perf_counter()
+                try:
+                    plan, result = run_query_plan(
+                        df, question, document["profile_text"],
+                        lambda prompt, payload: self._generate(document, prompt, payload, question, stats),
+                    )
+                except QueryPlanError as plan_e:
+                    # The answer falls back to the profile alone.
+                    plan, result = None, None
+                    record["query_plan_error"] = str(plan_e)
+                timing["plan_seconds"] = round(time.perf_counter() - plan_start, 4)
+                record["query_plan"] = plan
+                if result is not None:
+                    record["query_result"] = result.to_dict(orient="records")
+                    computed_results = format_computed_results(len(df), plan, result)
+
+            prompt = build_insight_prompt(data_for_llm, data_format_desc, question, extension, computed_results)
+            answer_start = time.perf_counter()
+            response_text = self._generate(document, prompt, data_for_llm + computed_results, question, stats)
+            timing["answer_seconds"] = round(time.perf_counter() - answer_start, 4)
+            record["chart_spec"] = extract_chart_json(response_text)
+            record["answer"] = strip_chart_json(response_text)
+            record["error"] = None
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        timing["total_seconds"] = round(time.perf_counter() - start, 4)
+        record["timing"] = timing
+        record.update(stats)
+        return record
+
+
+def run_batch(paths, questions, runner, output_path, concurrency, cache_dir):
+    """Loads every file, answers every question, and streams records to output_path.
+
+    Returns the number of failed requests.
+    """
+    failures = 0
+    write_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, open(output_path, "w", encoding="utf-8") as out:
+        def write(record):
+            with write_lock:
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+
+        loads = {executor.submit(load_file, path, cache_dir): path for path in paths}
+        answers = []
+        for future in as_completed(loads):
+            try:
+                document = future.result()
+            except Exception as e:
+                failures += len(questions)
+                for question in questions:
+                    write({"file": loads[future], "question": question, "error": f"{type(e).__name__}: {e}"})
+                continue
+            answers.extend(executor.submit(runner.answer, document, question) for question in questions)
+
+        for future in as_completed(answers):
+            record = future.result()
+            failures += record["error"] is not None
+            write(record)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a question set over a directory of CSV, Excel and PDF files.")
+    parser.add_argument("directory", help="Directory containing the files to analyse.")
+    parser.add_argument("--questions", required=True, help="Text file with one question per line, or a JSON list.")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file to write results to.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of requests in flight at once.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Maximum model calls per second (0 = unlimited).")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per model call after a failure.")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Initial retry backoff in seconds.")
+    parser.add_argument("--model", choices=("gemini", "stub"), default="gemini", help="Model backend.")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Simulated latency per stub call, in seconds.")
+    parser.add_argument("--cache", action="store_true", help="Reuse and fill the app's on-disk response cache.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    cache_dir = os.getenv("INSIGHT_CACHE_DIR", ".insight_cache")
+
+    paths = discover_files(args.directory)
+    questions = load_questions(args.questions)
+    if not paths or not questions:
+        parser.error("Need at least one supported file and one question.")
+
+    model_name = GEMINI_MODEL_NAME if args.model == "gemini" else "stub"
+    response_cache = ResponseCache(os.path.join(cache_dir, "responses.sqlite3")) if args.cache else None
+    runner = BatchRunner(
+        create_model(args.model, args.stub_latency), model_name, RateLimiter(args.rate),
+        retries=args.retries, backoff=args.backoff, response_cache=response_cache,
+    )
+
+    start = time.perf_counter()
+    failures = run_batch(paths, questions, runner, args.output, args.concurrency, cache_dir)
+    elapsed = time.perf_counter() - start
+    total = len(paths) * len(questions)
+    print(f"{total} requests over {len(paths)} files in {elapsed:.2f}s "
+          f"({total / elapsed:.1f} req/s), {failures} failed. Results: {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""Offline benchmark suite for the Project Insight pipeline.
+
+Times each stage on synthetic data of increasing size: file loading (CSV,
+XLSX and PDF, cold and from the frame cache), prompt construction, chart-spec
+extraction and cleanup on large responses, chart construction for every
+chart type on the largest loaded CSV, and the end-to-end question pipeline against a deterministic stub
+model with simulated latency. Nothing touches the network.
+
+Results are written as JSON and can be compared against a stored baseline.
+Comparisons use the fastest run of each benchmark, which is far less noisy
+than the median, and ignore slowdowns below a couple of milliseconds:
+
+    python benchmark.py                                  # run, write benchmark_results.json
+    python benchmark.py --compare benchmark_baseline.json
+    python benchmark.py --save-baseline benchmark_baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch import BatchRunner, RateLimiter
+from charts import CHART_TYPES, build_chart
+from insight import (
+    build_document_state,
+    build_insight_prompt,
+    extract_chart_json,
+    load_document,
+    select_llm_data,
+    strip_chart_json,
+)
+from response_cache import file_digest
+from stub_model import StubModel
+
+CSV_ROWS = (10_000, 100_000, 1_000_000)
+XLSX_ROWS = (1_000, 10_000)
+PDF_PAGES = (10, 100, 300)
+RESPONSE_SIZES = (10_000, 1_000_000)
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEAT = 5
+# Slowdowns smaller than this are timer and scheduler noise, whatever the ratio.
+MIN_REGRESSION_S = 0.002
+# Suite runs, each in a fresh process, recorded into a saved baseline.
+BASELINE_RUNS = 3
+
+CHART_SPECS = {
+    "bar": {"chart_type": "bar", "x_column": "department", "y_column": "salary", "aggregation": "average"},
+    "line": {"chart_type": "line", "x_column": "hired", "y_column": "salary"},
+    "scatter": {"chart_type": "scatter", "x_column": "age", "y_column": "salary"},
+    "histogram": {"chart_type": "histogram", "x_column": "salary"},
+}
+
+
+# --- Synthetic data ---
+
+def make_table(rows, seed=0):
+    """Returns a deterministic employee-style table with numeric, categorical and date columns."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "department": rng.choice(["Sales", "Engineering", "HR", "Operations", "Finance"], rows),
+        "gender": rng.choice(["Female", "Male"], rows),
+        "age": rng.integers(18, 65, rows),
+        "experience_years": rng.integers(0, 40, rows),
+        "salary": rng.normal(60000, 15000, rows).round(2),
+        "hired": pd.Timestamp("2000-01-01") + pd.to_timedelta(rng.integers(0, 9000, rows), unit="D"),
+    })
+
+
+def make_pdf(pages, lines_per_page=40):
+    """Builds a minimal text PDF with the given number of pages, without extra dependencies."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1} clause {line}: the supplier shall deliver item {page * lines_per_page + line}."
+                 for line in range(lines_per_page)]
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 9 Tf 12 TL 40 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{object_id} 0 R" for object_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_response(size):
+    """Returns a model-style response of roughly `size` characters with a chart block up front."""
+    chart = json.dumps(CHART_SPECS["bar"], indent=2)
+    sentence = "The average salary differs across departments, with Engineering highest. "
+    return f"```json\n{chart}\n```\n" + sentence * max(1, size // len(sentence))
+
+
+# --- Timing ---
+
+def measure(func, repeat):
+    """Runs func `repeat` times and returns timing statistics in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeat": repeat}
+
+
+def is_regression(stats, reference, threshold, min_regression_s=MIN_REGRESSION_S):
+    """Returns True if stats' fastest run is more than threshold and min_regression_s slower than reference's."""
+    before, after = reference.get("min_s", reference["median_s"]), stats["min_s"]
+    return after > before * (1 + threshold) and after - before > min_regression_s
+
+
+def run_suite(repeat, model_latency, scale, baseline=None, threshold=DEFAULT_THRESHOLD):
+    """Runs every benchmark and returns {name: stats}.
+
+    With a baseline, a benchmark that looks regressed is measured once more
+    and the faster measurement kept, so a burst of background load on the
+    machine does not fail the comparison.
+    """
+    results = {}
+    cache_root = tempfile.mkdtemp(prefix="insight-bench-")
+    references = (baseline or {}).get("results", {})
+
+    def record(name, func, times=repeat):
+        results[name] = measure(func, times)
+        if name in references and is_regression(results[name], references[name], threshold):
+            results[name] = min(results[name], measure(func, times), key=lambda stats: stats["min_s"])
+        print(f"{name:<45} {results[name]['median_s'] * 1000:10.2f} ms", flush=True)
+
+    def fresh_cache():
+        # A new directory per run, so "cold" loads never hit the frame cache.
+        return tempfile.mkdtemp(dir=cache_root)
+
+    try:
+        documents = {}
+        for rows in (int(r * scale) for r in CSV_ROWS):
+            data = make_table(rows).to_csv(index=False).encode()
+            digest = file_digest(data)
+            record(f"load_csv_cold[{rows}]", lambda: load_document(data, '.csv', digest, fresh_cache()))
+            warm = fresh_cache()
+            load_document(data, '.csv', digest, warm)
+            record(f"load_csv_cached[{rows}]", lambda: load_document(data, '.csv', digest, warm))
+            documents[('.csv', rows)] = load_document(data, '.csv', digest, warm)
+
+        for rows in (int(r * scale) for r in XLSX_ROWS):
+            buffer = io.BytesIO()
+            make_table(rows).to_excel(buffer, index=False)
+            data = buffer.getvalue()
+            digest = file_digest(data)
+            record(f"load_xlsx_cold[{rows}]", lambda: load_document(data, '.xlsx', digest, fresh_cache()))
+
+        for pages in (max(1, int(p * scale)) for p in PDF_PAGES):
+            data = make_pdf(pages)
+            record(f"load_pdf[{pages}]", lambda: load_document(data, '.pdf', file_digest(data), cache_root), times=1)
+            documents[('.pdf', pages)] = load_document(data, '.pdf', file_digest(data), cache_root)
+
+        question = "What is the average salary by department for the supplier clauses?"
+        for (extension, size), df in documents.items():
+            def build_prompt():
+                state = build_document_state(df, extension)
+                data_for_llm, description = select_llm_data(
+                    df, extension, question, state["pdf_index"], state["profile_text"], state["pdf_tables"]
+                )
+                return build_insight_prompt(data_for_llm, description, question, extension)
+            record(f"prompt{extension}[{size}]", build_prompt)
+
+        for size in RESPONSE_SIZES:
+            response = make_response(size)
+            record(f"extract_chart_json[{size}]", lambda: extract_chart_json(response))
+            record(f"strip_chart_json[{size}]", lambda: strip_chart_json(response))
+
+        # Charts are drawn from what the app charts: the largest CSV as load_document returns it.
+        chart_rows = int(CSV_ROWS[-1] * scale)
+        chart_df = documents[('.csv', chart_rows)]
+        for chart_type in CHART_TYPES:
+            spec = CHART_SPECS[chart_type]
+            record(f"chart_{chart_type}[{chart_rows}]", lambda: build_chart(chart_df, spec)[0].to_dict())
+
+        table_rows = int(CSV_ROWS[0] * scale)
+        document = {"path": "synthetic.csv", "extension": '.csv', "digest": "bench", "load_seconds": 0.0,
+                    "df": documents[('.csv', table_rows)]}
+        document.update(build_document_state(document["df"], '.csv'))
+        plan = '```json\n{"group_by": ["department"], "aggregations": [{"column": "salary", "func": "mean"}]}\n```'
+        stub = StubModel(
+            latency=model_latency,
+            respond=lambda prompt: plan if "JSON query plan" in prompt else make_response(2_000),
+        )
+        runner = BatchRunner(stub, "stub", RateLimiter(0), retries=0)
+        record(f"pipeline_end_to_end[{table_rows}]", lambda: runner.answer(document, question))
+    finally:
+        shutil.rmtree(cache_root, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold, min_regression_s=MIN_REGRESSION_S):
+    """Returns a list of (name, baseline_s, current_s) for benchmarks slower than the baseline allows.
+
+    Fastest runs are compared. A benchmark regresses when it is more than
+    threshold slower and also more than min_regression_s slower.
+    """
+    regressions = []
+    for name, stats in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference and is_regression(stats, reference, threshold, min_regression_s):
+            regressions.append((name, reference.get("min_s", reference["median_s"]), stats["min_s"]))
+    return regressions
+
+
+def merge_runs(runs):
+    """Combines suite runs into baseline results, keeping each benchmark's slowest fastest-run.
+
+    Some timings shift between processes (memory layout, page cache) by more
+    than the threshold, so a baseline from a single lucky process would fail
+    later runs of the unchanged tree.
+    """
+    return {name: max((run[name] for run in runs), key=lambda stats: stats["min_s"]) for name in runs[0]}
+
+
+def run_suite_in_subprocess(args):
+    """Runs the suite in a fresh Python process with the same settings and returns its results."""
+    with tempfile.TemporaryDirectory(prefix="insight-bench-") as tmp:
+        output = os.path.join(tmp, "results.json")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--output", output, "--repeat", str(args.repeat),
+             "--model-latency", str(args.model_latency), "--scale", str(args.scale)],
+            check=True,
+        )
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)["results"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Project Insight pipeline offline.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results JSON.")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON to compare against.")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Also write a new baseline, from this and further runs.")
+    parser.add_argument("--baseline-runs", type=int, default=BASELINE_RUNS,
+                        help="Suite runs (separate processes) a saved baseline is taken from.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before a benchmark counts as a regression (0.25 = 25%%).")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="Runs per benchmark (median is reported, the fastest run is compared).")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Simulated stub model latency in seconds.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for all dataset sizes (e.g. 0.1 for a quick run).")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pandas": pd.__version__,
+            "scale": args.scale,
+            "model_latency_s": args.model_latency,
+        },
+        "results": run_suite(args.repeat, args.model_latency, args.scale, baseline, args.threshold),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        runs = [report["results"]] + [run_suite_in_subprocess(args) for _ in range(args.baseline_runs - 1)]
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({**report, "meta": {**report["meta"], "runs": len(runs)}, "results": merge_runs(runs)}, f, indent=2)
+
+    if baseline is not None:
+        if baseline.get("meta", {}).get("cpu_count") != os.cpu_count():
+            print(f"Warning: the baseline was recorded with {baseline.get('meta', {}).get('cpu_count')} CPUs, "
+                  f"this machine has {os.cpu_count()}; regenerate it with --save-baseline for a fair comparison.")
+        regressions = compare(report["results"], baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms (fastest run)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
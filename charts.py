@@ -0,0 +1,219 @@
+"""Chart data preparation and Altair chart construction.
+
+Altair embeds every row of its data in the page, so charts are never built
+from the raw DataFrame. Bar charts and histograms are aggregated in pandas
+first, and line and scatter data are reduced to a fixed point budget (LTTB
+downsampling for lines, binned density for scatter plots). The browser payload
+therefore stays roughly the same size however large the dataset is.
+
+Altair itself is only imported once a chart is actually built, which keeps
+app start-up fast.
+"""
+import numpy as np
+import pandas as pd
+
+CHART_TYPES = ("bar", "line", "scatter", "histogram")
+DEFAULT_POINT_BUDGET = 2000
+DEFAULT_HISTOGRAM_BINS = 30
+
+# Chart spec aggregation names -> pandas aggregation functions
+AGGREGATIONS = {
+    "sum": "sum",
+    "average": "mean",
+    "mean": "mean",
+    "count": "count",
+    "min": "min",
+    "max": "max",
+    "median": "median",
+}
+
+
+class ChartSpecError(ValueError):
+    """Raised when a chart spec cannot be rendered against the data."""
+
+
+def _is_continuous(series):
+    return pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+
+
+def _as_float(series):
+    """Returns a float view of a numeric or datetime series for downsampling maths."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype("int64").to_numpy(dtype=float)
+    return series.to_numpy(dtype=float)
+
+
+def _numpy_backed(data):
+    """Returns small chart data with Arrow-backed columns converted to NumPy ones, which Altair expects."""
+    arrow_columns = [name for name, dtype in data.dtypes.items() if isinstance(dtype, pd.ArrowDtype)]
+    if not arrow_columns:
+        return data
+    import pyarrow as pa
+    converted = pa.table({name: data[name].array for name in arrow_columns}).to_pandas()
+    return data.assign(**{name: converted[name].set_axis(data.index) for name in arrow_columns})
+
+
+def _axis_type(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'temporal'
+    return 'quantitative' if pd.api.types.is_numeric_dtype(series) else 'nominal'
+
+
+def lttb_indices(x, y, threshold):
+    """Returns the indices kept by Largest-Triangle-Three-Buckets downsampling.
+
+    x must be sorted. The first and last points are always kept, and from each
+    bucket in between the point forming the largest triangle with its
+    neighbours is chosen, which preserves peaks and troughs.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end:edges[bucket + 2]].mean()
+            next_y = y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs(
+            (x[anchor] - next_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (next_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def _bar_data(df, x_column, y_column, aggregation, max_points):
+    if y_column and aggregation:
+        func = AGGREGATIONS.get(aggregation.lower())
+        if func is None:
+            raise ChartSpecError(f"Unsupported aggregation for chart: {aggregation}.")
+        value_title = f'{aggregation.capitalize()} of {y_column}'
+        data = df.groupby(x_column, observed=True, dropna=False)[y_column].agg(func).reset_index(name=value_title)
+    else:
+        value_title = 'Count of Records'
+        data = df[x_column].value_counts(dropna=False).rename_axis(x_column).reset_index(name=value_title)
+    note = None
+    if len(data) > max_points:
+        note = f"Showing the top {max_points:,} of {len(data):,} categories."
+        data = data.nlargest(max_points, value_title)
+    return data, value_title, note
+
+
+def _histogram_data(series, bins):
+    values = series.to_numpy(dtype=float)
+    values = values[np.isfinite(values)]
+    counts, bin_edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({"bin_start": bin_edges[:-1], "bin_end": bin_edges[1:], "Frequency": counts})
+
+
+def _line_data(df, x_column, y_column, max_points):
+    data = df[[x_column, y_column]].dropna()
+    if len(data) <= max_points:
+        return data, None
+    if _is_continuous(data[x_column]) and pd.api.types.is_numeric_dtype(data[y_column]):
+        data = data.sort_values(x_column, kind="stable")
+        keep = lttb_indices(_as_float(data[x_column]), _as_float(data[y_column]), max_points)
+        return data.iloc[keep], f"Showing {max_points:,} of {len(data):,} points (LTTB downsampled)."
+    # Ordinal x: one point per category, averaged.
+    total = len(data)
+    data = data.groupby(x_column, observed=True, sort=True)[y_column].mean().reset_index().head(max_points)
+    return data, f"Averaged {total:,} rows into {len(data):,} points."
+
+
+def _scatter_data(df, x_column, y_column, max_points):
+    data = df[[x_column, y_column]].dropna()
+    if len(data) <= max_points:
+        return data, None, False
+    if _is_continuous(data[x_column]) and _is_continuous(data[y_column]):
+        bins = max(int(np.sqrt(max_points)), 2)
+        counts, x_edges, y_edges = np.histogram2d(_as_float(data[x_column]), _as_float(data[y_column]), bins=bins)
+        x_index, y_index = np.nonzero(counts)
+        density = pd.DataFrame({
+            x_column: (x_edges[x_index] + x_edges[x_index + 1]) / 2,
+            y_column: (y_edges[y_index] + y_edges[y_index + 1]) / 2,
+            "Points": counts[x_index, y_index].astype(np.int64),
+        })
+        for column in (x_column, y_column):
+            if pd.api.types.is_datetime64_any_dtype(data[column]):
+                # Bin centres are in the column's own unit (s, ms, us or ns), so convert back with its dtype.
+                density[column] = density[column].astype("int64").astype(data[column].dtype)
+        return density, f"Showing the density of {len(data):,} points in {len(density):,} bins.", True
+    return data.sample(max_points, random_state=0), f"Showing a sample of {max_points:,} of {len(data):,} points.", False
+
+
+def build_chart(df, chart_spec, max_points=DEFAULT_POINT_BUDGET):
+    """Builds an Altair chart from a chart spec over pre-aggregated data.
+
+    Returns (chart, note), where note describes any reduction applied to the
+    data (or is None). Raises ChartSpecError if the spec cannot be rendered.
+    """
+    import altair as alt  # Imported lazily; most reruns never draw a chart
+
+    chart_type = chart_spec.get('chart_type')
+    x_column = chart_spec.get('x_column')
+    y_column = chart_spec.get('y_column')
+    aggregation = chart_spec.get('aggregation')
+    chart_title = chart_spec.get('title') or f"{x_column} vs {y_column if y_column else 'Count'}"
+
+    if not x_column:
+        raise ChartSpecError(f"Chart type '{chart_type}' requires an x_column to be specified.")
+    for column in (x_column, y_column):
+        if column and column not in df.columns:
+            raise ChartSpecError(f"Column '{column}' not found in data.")
+
+    note = None
+    if chart_type == "bar":
+        data, value_title, note = _bar_data(df, x_column, y_column, aggregation, max_points)
+        data = _numpy_backed(data)
+        chart = alt.Chart(data).mark_bar().encode(
+            x=alt.X(x_column, type='nominal'),
+            y=alt.Y(value_title, type='quantitative', title=value_title),
+            tooltip=[x_column, value_title]
+        )
+    elif chart_type == "line" and y_column:
+        data, note = _line_data(df, x_column, y_column, max_points)
+        data = _numpy_backed(data)
+        chart = alt.Chart(data).mark_line().encode(
+            x=alt.X(x_column, type=_axis_type(data[x_column])),
+            y=alt.Y(y_column, type=_axis_type(data[y_column])),
+            tooltip=[x_column, y_column]
+        )
+    elif chart_type == "scatter" and y_column:
+        data, note, binned = _scatter_data(df, x_column, y_column, max_points)
+        data = _numpy_backed(data)
+        encoding = dict(
+            x=alt.X(x_column, type=_axis_type(data[x_column])),
+            y=alt.Y(y_column, type=_axis_type(data[y_column])),
+            tooltip=[x_column, y_column] + (["Points"] if binned else []),
+        )
+        if binned:
+            chart = alt.Chart(data).mark_circle().encode(size=alt.Size("Points", type='quantitative'), **encoding)
+        else:
+            chart = alt.Chart(data).mark_point().encode(**encoding)
+    elif chart_type == "histogram":
+        if pd.api.types.is_numeric_dtype(df[x_column]):
+            data = _histogram_data(df[x_column], chart_spec.get('bins') or DEFAULT_HISTOGRAM_BINS)
+            chart = alt.Chart(data).mark_bar().encode(
+                alt.X("bin_start", type='quantitative', bin='binned', title=x_column),
+                alt.X2("bin_end"),
+                alt.Y("Frequency", type='quantitative', title='Frequency'),
+                tooltip=["bin_start", "bin_end", "Frequency"]
+            )
+        else:
+            data, _, note = _bar_data(df, x_column, None, None, max_points)
+            data = _numpy_backed(data)
+            chart = alt.Chart(data).mark_bar().encode(
+                x=alt.X(x_column, type='nominal', title=x_column),
+                y=alt.Y('Count of Records', type='quantitative', title='Frequency')
+            )
+    else:
+        raise ChartSpecError(f"Unsupported chart type or missing required columns for chart: {chart_type}.")
+
+    return chart.properties(title=chart_title), note
@@ -0,0 +1,168 @@
+"""Multi-turn conversations about one document.
+
+A conversation has a context, the document (profile, excerpts or full text)
+plus the instruction block, built from the first question. With
+cache_context, the context is stored with Gemini's context caching
+(CachedContent) and every turn sends only the kept history and the new
+message against it, so follow-ups never carry the document again. Query plan
+requests for tabular files go through the same cached context, so the
+profile is not resent either.
+
+Gemini only caches contexts above a minimum size (32k tokens for gemini-1.5),
+which most documents' contexts do not reach. Without a cache, each turn is a
+stateless generate_content call: the first sends the full context, and
+follow-ups send a compact follow-up context instead (the instruction block
+and the document's outline), the kept history and the new message, which
+brings the excerpts or computed results the question needs. Older turns are
+dropped once the history exceeds a token budget.
+
+Works with anything that provides generate_content(contents, stream=...)
+taking a list of {"role", "parts"} messages: genai.GenerativeModel or
+StubModel.
+"""
+import datetime
+import json
+
+from metrics import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 32000
+DEFAULT_CACHE_TTL_SECONDS = 3600
+# Gemini rejects cached contents smaller than this (gemini-1.5 models).
+MIN_CACHED_TOKENS = 32768
+
+
+def gemini_context_cache(model, context, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS):
+    """Stores context with Gemini context caching and returns a model bound to it.
+
+    Raises ValueError for contexts below the minimum cached size, without an
+    API call; API errors (e.g. a model version without caching) propagate.
+    """
+    if estimate_tokens(context) < MIN_CACHED_TOKENS:
+        raise ValueError(f"context is below the {MIN_CACHED_TOKENS}-token minimum for context caching")
+    import google.generativeai as genai
+    from google.generativeai import caching
+    cache = caching.CachedContent.create(
+        model=model.model_name,
+        contents=[context],
+        ttl=datetime.timedelta(seconds=ttl_seconds),
+    )
+    return genai.GenerativeModel.from_cached_content(cached_content=cache)
+
+
+class DocumentConversation:
+    """The context and turns of a chat about one document, trimmed to a token budget.
+
+    cache_context(model, context), if given, returns a model bound to the
+    cached context (see gemini_context_cache) or raises if it cannot.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, cache_context=None):
+        self.token_budget = token_budget
+        self.cache_context = cache_context
+        self.context = None
+        self.followup_context = None
+        self.context_chunks = []
+        self.cached_model = None
+        self._cache_tried = False
+        self.turns = []
+
+    @property
+    def started(self):
+        return self.context is not None
+
+    def start(self, context, chunks=(), followup_context=None):
+        """Sets the document context (and the ids of the PDF chunks it contains).
+
+        followup_context, if given, replaces the context in follow-ups sent
+        without a cached context.
+        """
+        self.context = context
+        self.context_chunks = list(chunks)
+        self.followup_context = followup_context
+
+    def _full_context(self):
+        """Whether the next message goes with the full context: cached, for the first turn, or without a follow-up context."""
+        return self.cached_model is not None or not self.turns or self.followup_context is None
+
+    def sent_context(self):
+        """Returns the context sent along with the next message when it is not cached."""
+        return self.context if self._full_context() else self.followup_context
+
+    def kept_turns(self):
+        """Returns as many of the most recent turns as fit the token budget."""
+        budget = self.token_budget
+        kept = []
+        for turn in reversed(self.turns):
+            budget -= turn["tokens"]
+            if budget < 0:
+                break
+            kept.append(turn)
+        return kept[::-1]
+
+    def history(self):
+        """Returns the kept turns as Gemini messages."""
+        history = []
+        for turn in self.kept_turns():
+            history.append({"role": "user", "parts": [turn["message"]]})
+            history.append({"role": "model", "parts": [turn["answer"]]})
+        return history
+
+    def history_tokens(self):
+        return sum(turn["tokens"] for turn in self.kept_turns())
+
+    def overhead_tokens(self, with_history=True):
+        """Returns the estimated tokens sent along with each message: history, plus the context unless cached."""
+        context_tokens = 0 if self.cached_model is not None else estimate_tokens(self.sent_context() or "")
+        return context_tokens + (self.history_tokens() if with_history else 0)
+
+    def sent_chunks(self):
+        """Returns the ids of PDF chunks the next message goes with: in the full context or the kept history."""
+        chunks = set(self.context_chunks) if self._full_context() else set()
+        return chunks | {chunk for turn in self.kept_turns() for chunk in turn["chunks"]}
+
+    def contents(self, message, with_history=True, with_context=True):
+        """Returns the messages to send for message; the context goes in the first user message."""
+        contents = (self.history() if with_history else []) + [{"role": "user", "parts": [message]}]
+        if with_context:
+            contents[0] = {"role": "user", "parts": [self.sent_context()] + contents[0]["parts"]}
+        return contents
+
+    def cache_payload(self, message, with_history=True):
+        """Returns the response-cache payload for sending message in this conversation."""
+        return self.sent_context() + json.dumps(self.history() if with_history else []) + message
+
+    def _cached_model(self, model):
+        if self.cached_model is None and self.cache_context is not None and not self._cache_tried:
+            self._cache_tried = True
+            try:
+                self.cached_model = self.cache_context(model, self.context)
+            except Exception as e:
+                print(f"Context caching unavailable ({e}); sending the document context with each turn.")
+        return self.cached_model
+
+    def context_cached(self, model):
+        """Returns whether the context is cached for model, trying to cache it the first time."""
+        return self._cached_model(model) is not None
+
+    def send(self, model, message, stream=False, with_history=True):
+        """Sends message (after the kept history) and returns the model's response."""
+        cached_model = self._cached_model(model)
+        if cached_model is not None:
+            try:
+                return cached_model.generate_content(self.contents(message, with_history, with_context=False), stream=stream)
+            except Exception as e:
+                # Most likely the cache expired; it is created again on the next turn.
+                print(f"Cached context failed ({e}); sending the document context instead.")
+                self.cached_model = None
+                self._cache_tried = False
+        return model.generate_content(self.contents(message, with_history), stream=stream)
+
+    def record(self, question, message, answer, chunks=()):
+        """Adds a completed turn."""
+        self.turns.append({
+            "question": question,
+            "message": message,
+            "answer": answer,
+            "chunks": list(chunks),
+            "tokens": estimate_tokens(message) + estimate_tokens(answer),
+        })
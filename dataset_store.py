@@ -0,0 +1,208 @@
+"""Process-wide, content-addressed store for loaded documents.
+
+Every session that opens the same file (same content digest) is served the
+same DataFrame instead of its own copy. Sessions keep only a DatasetHandle
+and look the frame up on each run, so the store stays free to drop a frame
+even while sessions that use it are still open.
+
+Stored frames are memory-mapped from the uncompressed Feather frame cache. A
+freshly parsed document is written there first and mapped back, so its
+columns become read-only Arrow buffers over the file (see ingest.py) that
+every session shares zero-copy. Frames handed out by the store must be
+treated as read-only: the pipeline only ever derives new frames from them
+(filters, aggregations, samples), which pandas' copy-on-write keeps separate
+from the shared data.
+
+Entries are bounded by a ceiling on the heap memory they hold. Mapped columns
+live in the OS page cache rather than on the heap, so they are not charged;
+only frames that could not be written to disk (and index data) are. Values
+derived from a frame (retrieval index, profile, extracted tables) live on
+the heap and are charged to its entry. Once the ceiling is exceeded, the
+least recently used entries are dropped, derived values and all; an entry
+whose frame could not be written to disk keeps its frame and only loses its
+derived values. A dropped frame is mapped back from disk on its next lookup,
+and dropped derived values are computed again when next asked for.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from ingest import has_cached_frame, read_cached_frame, write_cached_frame
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def frame_bytes(df):
+    """Returns the heap memory held by a DataFrame, including its index.
+
+    Arrow-backed columns only come from the memory-mapped frame cache, so
+    they are not counted.
+    """
+    usage = df.memory_usage(index=True, deep=True).to_numpy()
+    on_heap = [not isinstance(dtype, pd.ArrowDtype) for dtype in df.dtypes]
+    return int(usage[0] + usage[1:][on_heap].sum())
+
+
+def value_bytes(value):
+    """Estimates the heap memory held by a derived value.
+
+    Handles DataFrames, objects reporting nbytes (arrays, BM25Index), strings
+    and dicts, lists or tuples of these.
+    """
+    if isinstance(value, pd.DataFrame):
+        return frame_bytes(value)
+    if isinstance(value, dict):
+        return sum(value_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_bytes(item) for item in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class DatasetHandle:
+    """A session's reference to a stored document. Cheap to keep; resolves to the shared frame."""
+
+    def __init__(self, store, digest, extension):
+        self.store = store
+        self.digest = digest
+        self.extension = extension
+
+    def frame(self):
+        return self.store.get(self.digest)
+
+    def derived(self, name, factory):
+        return self.store.derived(self.digest, name, factory)
+
+
+class DatasetStore:
+    """A thread-safe LRU store of DataFrames keyed by file digest, bounded by max_bytes."""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # digest -> {"frame", "bytes", "derived", "derived_bytes"}
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._digest_locks = {}
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def _digest_lock(self, digest):
+        # One loader per digest: concurrent sessions opening the same file wait for it.
+        with self._lock:
+            return self._digest_locks.setdefault(digest, threading.Lock())
+
+    def _lookup(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+            return entry
+
+    def _map(self, digest, df):
+        """Writes df to the frame cache if needed and returns the memory-mapped copy (or df itself)."""
+        if not has_cached_frame(self.cache_dir, digest):
+            write_cached_frame(self.cache_dir, digest, df)
+        mapped = read_cached_frame(self.cache_dir, digest)
+        return df if mapped is None else mapped
+
+    def _insert(self, digest, df):
+        with self._lock:
+            self._entries[digest] = {"frame": df, "bytes": frame_bytes(df), "derived": {}, "derived_bytes": 0}
+        self._evict(keep=digest)
+        return df
+
+    def _evict(self, keep):
+        """Drops least recently used entries until the store fits its ceiling again."""
+        with self._evict_lock, self._lock:
+            total = sum(entry["bytes"] + entry["derived_bytes"] for entry in self._entries.values())
+            for digest in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                # The newest entry stays even if it alone exceeds the ceiling.
+                if digest == keep:
+                    continue
+                entry = self._entries[digest]
+                if has_cached_frame(self.cache_dir, digest):
+                    del self._entries[digest]
+                    total -= entry["bytes"] + entry["derived_bytes"]
+                elif entry["derived"]:
+                    # A frame that could not be written to disk cannot be dropped, but its derived values can.
+                    total -= entry["derived_bytes"]
+                    entry["derived"], entry["derived_bytes"] = {}, 0
+                else:
+                    continue
+                self.evictions += 1
+
+    def load(self, digest, extension, loader):
+        """Returns a handle to the document with this digest.
+
+        loader() is only called if the frame is neither in memory nor in the
+        on-disk frame cache.
+        """
+        if self._lookup(digest) is None:
+            with self._digest_lock(digest):
+                if self._lookup(digest) is None:
+                    df = read_cached_frame(self.cache_dir, digest)
+                    if df is None:
+                        df = self._map(digest, loader())
+                        self.loads += 1
+                    else:
+                        self.reloads += 1
+                    self._insert(digest, df)
+        return DatasetHandle(self, digest, extension)
+
+    def get(self, digest):
+        """Returns the shared frame for a digest, mapping it back from disk if it was evicted."""
+        entry = self._lookup(digest)
+        if entry is not None:
+            return entry["frame"]
+        with self._digest_lock(digest):
+            entry = self._lookup(digest)
+            if entry is not None:
+                return entry["frame"]
+            df = read_cached_frame(self.cache_dir, digest)
+            if df is None:
+                raise KeyError(f"Dataset {digest} is no longer available; please upload it again.")
+            self.reloads += 1
+            return self._insert(digest, df)
+
+    def derived(self, digest, name, factory):
+        """Returns a value derived from a stored frame, computing factory(frame) once per residency.
+
+        The value is charged to the frame's entry, so storing it may evict
+        other entries.
+        """
+        df = self.get(digest)
+        with self._digest_lock(digest):
+            with self._lock:
+                entry = self._entries.get(digest)
+                if entry is not None and name in entry["derived"]:
+                    return entry["derived"][name]
+            value = factory(df)
+            size = value_bytes(value)
+            with self._lock:
+                entry = self._entries.get(digest)
+                if entry is not None:
+                    entry["derived"][name] = value
+                    entry["derived_bytes"] += size
+            self._evict(keep=digest)
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry["bytes"] + entry["derived_bytes"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
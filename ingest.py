@@ -0,0 +1,160 @@
+"""Columnar ingestion of CSV and Excel files.
+
+CSV files are parsed with the multi-threaded pyarrow engine and .xlsx files
+are streamed row by row with openpyxl's read-only mode. Integer columns are
+downcast and low-cardinality text columns become categoricals. Every parsed
+file is written to an uncompressed Feather (Arrow IPC) cache keyed on a hash
+of its contents, so re-opening the same file memory-maps the cached columns
+instead of parsing it again.
+
+Frames read from the cache keep their columns as Arrow-backed pandas arrays
+(pd.ArrowDtype) over the mapped file, so reading one allocates almost no
+memory: pages are loaded by the OS as they are touched and can be dropped
+again under memory pressure. Converting them to NumPy-backed columns would
+copy the whole frame onto the heap. Two column types are the exception,
+because pandas cannot sort, compare or chart their Arrow forms: dictionary
+columns come back as pandas Categoricals (only their small integer codes are
+copied), and date columns are stored as timestamps.
+"""
+import io
+import os
+
+import pandas as pd
+
+# Text columns with at most this share of distinct values become categoricals.
+CATEGORY_RATIO = 0.5
+# Text columns with more distinct values than this always stay as strings.
+MAX_CATEGORIES = 10000
+
+
+def read_csv(data):
+    """Parses CSV bytes, preferring the pyarrow engine and falling back to the default parser."""
+    try:
+        return pd.read_csv(io.BytesIO(data), engine="pyarrow")
+    except (ImportError, ValueError) as e:
+        # pyarrow is missing or rejected the file (e.g. ragged rows); the C parser is more lenient.
+        print(f"pyarrow CSV engine unavailable for this file ({e}); using the default parser.")
+        return pd.read_csv(io.BytesIO(data))
+
+
+def read_excel(data, extension):
+    """Parses Excel bytes. .xlsx sheets are streamed with openpyxl in read-only mode."""
+    if extension != '.xlsx':
+        return pd.read_excel(io.BytesIO(data))
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        names = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        columns = [[] for _ in names]
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            for column, value in zip(columns, row):
+                column.append(value)
+            # Short rows are padded so every column keeps the same length.
+            for column in columns[len(row):]:
+                column.append(None)
+    finally:
+        workbook.close()
+    return pd.DataFrame({name: pd.Series(values).infer_objects() for name, values in zip(names, columns)})
+
+
+def optimize_dtypes(df):
+    """Downcasts integer columns and converts low-cardinality text columns to categoricals.
+
+    Float columns stay float64: float32 results would change the figures that
+    query plans compute over the full frame.
+    """
+    optimized = {}
+    for name, series in df.items():
+        if pd.api.types.is_bool_dtype(series):
+            optimized[name] = series
+        elif pd.api.types.is_integer_dtype(series):
+            optimized[name] = pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            distinct = series.nunique(dropna=True)
+            if distinct <= MAX_CATEGORIES and distinct <= CATEGORY_RATIO * len(series):
+                optimized[name] = series.astype("category")
+            else:
+                optimized[name] = series
+        else:
+            optimized[name] = series
+    return pd.DataFrame(optimized, index=df.index)
+
+
+def _cache_path(cache_dir, digest):
+    return os.path.join(cache_dir, f"{digest}.feather")
+
+
+def has_cached_frame(cache_dir, digest):
+    """Returns True if the frame cache holds a DataFrame for this file digest."""
+    return os.path.exists(_cache_path(cache_dir, digest))
+
+
+def _arrow_dtype(arrow_type):
+    import pyarrow as pa
+    # None keeps pandas' default conversion: dictionary columns become Categoricals.
+    return None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
+
+
+def _dates_as_timestamps(table):
+    """Casts date columns to timestamps, which pandas compares, sorts and charts like datetimes."""
+    import pyarrow as pa
+    for index, field in enumerate(table.schema):
+        if pa.types.is_date(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(pa.timestamp("us")))
+    return table
+
+
+def read_cached_frame(cache_dir, digest):
+    """Returns the cached DataFrame for a file digest, memory-mapped from disk, or None.
+
+    Columns other than categoricals are Arrow-backed views over the mapped
+    file; treat them as read-only.
+    """
+    path = _cache_path(cache_dir, digest)
+    if not os.path.exists(path):
+        return None
+    from pyarrow import feather
+    try:
+        return feather.read_table(path, memory_map=True).to_pandas(types_mapper=_arrow_dtype)
+    except Exception as e:
+        print(f"Ignoring unreadable frame cache {path}: {e}")
+        return None
+
+
+def write_cached_frame(cache_dir, digest, df):
+    """Writes df to the frame cache. Failures are logged and otherwise ignored."""
+    try:
+        import pyarrow as pa
+        from pyarrow import feather
+        os.makedirs(cache_dir, exist_ok=True)
+        path = _cache_path(cache_dir, digest)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        table = _dates_as_timestamps(pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False))
+        # Uncompressed so later reads can memory-map the column buffers directly.
+        feather.write_feather(table, temp_path, compression="uncompressed")
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"Could not write frame cache for {digest}: {e}")
+
+
+def load_table(data, extension, digest, cache_dir):
+    """Loads CSV or Excel bytes into an optimised DataFrame, using the frame cache when possible.
+
+    A freshly parsed table is written to the cache and mapped back, so the
+    parsed copy can be freed and cold and warm loads return the same dtypes.
+    """
+    df = read_cached_frame(cache_dir, digest)
+    if df is not None:
+        return df
+    df = read_csv(data) if extension == '.csv' else read_excel(data, extension)
+    df = optimize_dtypes(df)
+    write_cached_frame(cache_dir, digest, df)
+    mapped = read_cached_frame(cache_dir, digest)
+    return df if mapped is None else mapped
@@ -0,0 +1,336 @@
+"""Streamlit-free core of the Project Insight pipeline.
+
+Loading documents, preparing the context sent to Gemini, building prompts and
+parsing responses all live here, so the Streamlit app (main.py) and the batch
+CLI (batch.py) share exactly the same logic. Nothing in this module imports
+Streamlit.
+
+A response may open with a ```json chart spec block followed by the prose
+answer; the parsing helpers pull the two apart, both for complete responses
+and for responses that are still streaming in.
+"""
+import json
+import re
+
+from ingest import load_table
+from pdf_extraction import extract_pdf_frame
+from pdf_tables import build_pdf_tables, describe_pages, format_pdf_tables
+from profiling import format_profile, profile_dataframe
+from query_plan import PLAN_INSTRUCTIONS, execute_plan, extract_query_plan
+from retrieval import FULL_TEXT_CHAR_LIMIT, BM25Index, build_pdf_context, chunk_pages, format_chunks, select_chunks
+
+# Most excerpts a conversation turn adds; follow-ups tend to be narrower than first questions.
+FOLLOWUP_EXCERPTS = 4
+
+GEMINI_MODEL_NAME = "models/gemini-1.5-flash"
+# Bump whenever the prompt wording changes so cached responses are not reused.
+PROMPT_TEMPLATE_VERSION = "6"
+
+TABULAR_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+SUPPORTED_EXTENSIONS = TABULAR_EXTENSIONS + ('.pdf',)
+
+CHART_JSON_PATTERN = re.compile(r'```json\n({.*?})\n```', re.DOTALL)
+
+TABULAR_CHART_INSTRUCTION = """
+If a data visualization is appropriate for the question, first output a JSON object with the chart specifications.
+If the chart type is not explicitly requested, infer the most suitable chart type from the question and data.
+The JSON should be enclosed in triple backticks and `json` tag like this:
+```json
+{{
+  "chart_type": "bar" | "line" | "scatter" | "histogram",
+  "x_column": "column_name",
+  "y_column": "column_name" | null,
+  "aggregation": "sum" | "average" | "count" | null,
+  "title": "Chart Title (Optional)"
+}}
+```
+Valid `chart_type` values are "bar", "line", "scatter", "histogram".
+- For "bar" charts, `x_column` is typically categorical and `y_column` (if provided) is quantitative for aggregation. If `y_column` is null, assume count.
+- For "line" charts, `x_column` is typically temporal or ordinal, and `y_column` is quantitative.
+- For "scatter" charts, both `x_column` and `y_column` are quantitative.
+- For "histogram" charts, only `x_column` is needed (quantitative). `y_column` and `aggregation` should be null.
+Ensure column names in JSON exactly match those in the dataset.
+If no chart is suitable, do not include the JSON block.
+
+After the JSON (if present),
+"""
+
+PDF_CHART_INSTRUCTION = """
+If the question implies a visualization of structured (e.g., numerical or categorical) data that can be inferred from the text, first output a JSON object with the chart specifications. Otherwise, do not include a JSON block.
+The JSON should follow the same format as for tabular data.
+If the chart can be drawn from one of the tables extracted from the document, add a "table" key with that table's name (e.g. "table": "table_1") and use its exact column names; the chart is then computed from the real extracted values.
+Otherwise, use column names that best represent the inferred data. If no chart is suitable, do not include the JSON block.
+
+After the JSON (if present),
+"""
+
+
+class DocumentError(ValueError):
+    """Raised when a file cannot be loaded or has no usable content."""
+
+
+# --- Loading ---
+
+def load_document(data, extension, digest, cache_dir, on_page=None):
+    """Loads CSV, Excel, or PDF bytes into a DataFrame.
+
+    Tables go through the columnar ingestion cache; PDFs become one row per
+    page (page, text_content, tables), with on_page called as each page arrives.
+    """
+    if extension in TABULAR_EXTENSIONS:
+        return load_table(data, extension, digest, cache_dir)
+    if extension == '.pdf':
+        df = extract_pdf_frame(data, on_page)
+        if not df['text_content'].any():
+            raise DocumentError("No readable text could be extracted from the PDF. It might be an image-based PDF or corrupted.")
+        return df
+    raise DocumentError("Unsupported file type. Please upload a CSV, XLSX, XLS, or PDF file.")
+
+
+def build_document_state(df, extension):
+    """Computes the per-document state reused by every question.
+
+    PDFs get a BM25 retrieval index and their extracted tables as named,
+    typed DataFrames; tables get a formatted profile, and the same profile
+    without its sample rows as a summary for conversation follow-ups.
+    """
+    if extension == '.pdf':
+        return {
+            "pdf_index": BM25Index(chunk_pages(df['page'], df['text_content'])),
+            "profile_text": None,
+            "profile_summary": None,
+            "pdf_tables": build_pdf_tables(df),
+        }
+    profile = profile_dataframe(df)
+    return {
+        "pdf_index": None,
+        "profile_text": format_profile(profile),
+        "profile_summary": format_profile(profile, sample=False),
+        "pdf_tables": None,
+    }
+
+
+# --- Prompts ---
+
+def select_llm_data(df, extension, question, pdf_index=None, profile_text=None, pdf_tables=None):
+    """Returns (data_for_llm, data_format_desc) describing the document to the model."""
+    if extension == '.pdf':
+        if 'text_content' not in df.columns or df['text_content'].empty:
+            raise DocumentError("Could not find text content in the DataFrame for PDF analysis. Cannot proceed with AI analysis.")
+        if df['text_content'].str.len().sum() <= FULL_TEXT_CHAR_LIMIT:
+            data_for_llm, data_format_desc = "\n\n".join(text for text in df['text_content'] if text), "text content from the document"
+        else:
+            data_for_llm, data_format_desc = (
+                build_pdf_context(pdf_index, question),
+                "most relevant excerpts from the document, each labelled with its page number (cite these page numbers in your answer)",
+            )
+        if pdf_tables:
+            data_for_llm += "\n\nTables extracted from the document:\n" + format_pdf_tables(pdf_tables)
+            data_format_desc += ", followed by the tables extracted from it (named, with typed columns)"
+        return data_for_llm, data_format_desc
+    return (
+        profile_text,
+        "profile of the full dataset (column types, null counts, ranges, quantiles, most common values and correlations), followed by a small stratified sample of rows as CSV",
+    )
+
+
+def pdf_context_chunks(df, question, pdf_index):
+    """Returns the ids of the chunks select_llm_data sends for a PDF: all of a short document, else the question's."""
+    if df['text_content'].str.len().sum() <= FULL_TEXT_CHAR_LIMIT:
+        return list(range(len(pdf_index)))
+    return select_chunks(pdf_index, question)
+
+
+def new_pdf_excerpts(question, pdf_index, sent_chunks=(), max_chunks=FOLLOWUP_EXCERPTS):
+    """Returns (excerpts, chunk_ids) for up to max_chunks of the question's relevant chunks not already sent."""
+    chunk_ids = [chunk for chunk in select_chunks(pdf_index, question) if chunk not in sent_chunks][:max_chunks]
+    return format_chunks(pdf_index, chunk_ids), chunk_ids
+
+
+def select_chart_data(df, chart_spec, pdf_tables=None):
+    """Returns (data, table_name): the extracted PDF table a chart spec names, or df itself."""
+    table_name = chart_spec.get('table')
+    if pdf_tables and table_name in pdf_tables:
+        return pdf_tables[table_name], table_name
+    return df, None
+
+
+def _earlier_questions(earlier_questions):
+    earlier = "".join(f'- "{earlier_question}"\n' for earlier_question in earlier_questions)
+    return f"Earlier questions in this conversation, for context:\n{earlier}" if earlier else ""
+
+
+def build_plan_prompt(profile_text, question, earlier_questions=()):
+    """Builds the prompt asking Gemini for a query plan over a profiled table."""
+    return f"""
+You are planning a query over a table. Here is a profile of the full dataset:
+```
+{profile_text}
+```
+{PLAN_INSTRUCTIONS}
+{_earlier_questions(earlier_questions)}Question: "{question}"
+"""
+
+
+def build_conversation_plan_prompt(question, earlier_questions=()):
+    """Builds a query plan request for a conversation, whose context already holds the profile."""
+    return f"""
+Instead of answering, plan a query over the full dataset profiled above.
+{PLAN_INSTRUCTIONS}
+{_earlier_questions(earlier_questions)}
+Question: "{question}"
+"""
+
+
+def run_query_plan(df, question, profile_text, generate, plan_prompt=None):
+    """Asks the model for a query plan and executes it locally over the full DataFrame.
+
+    generate(prompt, payload) must return the model's response text. Returns
+    (plan, result), or (None, None) if the question needs no computation. Only
+    the dataset profile is sent to the model, never the full rows. plan_prompt
+    replaces the default prompt (which includes the profile), e.g. with one
+    from build_conversation_plan_prompt.
+    """
+    if plan_prompt is None:
+        plan_text = generate(build_plan_prompt(profile_text, question), f"plan:{profile_text}")
+    else:
+        plan_text = generate(plan_prompt, f"plan:{profile_text}{plan_prompt}")
+    plan = extract_query_plan(plan_text or "")
+    if plan is None:
+        return None, None
+    return plan, execute_plan(df, plan)
+
+
+def format_computed_results(row_count, plan, result):
+    """Renders locally computed query results as a prompt section."""
+    return f"""
+Exact results computed locally over all {row_count} rows with the query plan {json.dumps(plan)}:
+```
+{result.to_csv(index=False)}
+```
+Use these exact figures for any numbers in your answer; the sample rows above are only for context.
+"""
+
+
+def _analysis_instructions(extension):
+    chart_instruction = PDF_CHART_INSTRUCTION if extension == '.pdf' else TABULAR_CHART_INSTRUCTION
+    return f"""{chart_instruction}
+Provide a comprehensive explanation and analysis in natural language, including how the answer was derived from the content and any relevant context or limitations (e.g., if analyzing text, note it's based on inferred data).
+Do not provide any code outside of the specified JSON block (if applicable).
+"""
+
+
+def build_insight_prompt(data_for_llm, data_format_desc, question, extension, computed_results=""):
+    """Builds the main analysis prompt, including chart instructions."""
+    return f"""
+You are an expert data analyst and document summarizer. Below is the {data_format_desc}:
+```
+{data_for_llm}
+```
+
+{computed_results}
+Based on this content, please perform the requested analysis.
+{_analysis_instructions(extension)}
+Question: "{question}"
+"""
+
+
+def build_conversation_context(data_for_llm, data_format_desc, extension):
+    """Builds the context of a conversation: the document and the instruction block, without a question.
+
+    It is sent (or cached) once per conversation; each turn then only needs build_turn_prompt.
+    """
+    return f"""
+You are an expert data analyst and document summarizer. Below is the {data_format_desc}:
+```
+{data_for_llm}
+```
+
+Questions about this content follow, one per turn. For each question, perform the requested analysis.
+{_analysis_instructions(extension)}"""
+
+
+def build_followup_context(extension, profile_summary=None, pdf_tables=None):
+    """Builds the context of follow-ups that cannot use a cached context: the instruction block and the document's outline.
+
+    The outline is the profile without its sample rows, or a PDF's table names
+    and columns. The excerpts and exact figures a follow-up needs come with its
+    own turn prompt, and the kept history carries those of earlier turns.
+    """
+    if extension == '.pdf':
+        outline = "\n".join(
+            f"Table {name} ({describe_pages(table.attrs['pages'])}, {len(table)} rows); columns: "
+            + ", ".join(f"{column} ({dtype})" for column, dtype in table.dtypes.items())
+            for name, table in (pdf_tables or {}).items()
+        ) or "No tables were extracted from the document."
+        data_format_desc = "outline of a PDF document, whose excerpts come with each question"
+    else:
+        outline = profile_summary
+        data_format_desc = "profile of the full dataset (column types, null counts, ranges, quantiles, most common values and correlations)"
+    return build_conversation_context(outline, data_format_desc, extension)
+
+
+def build_turn_prompt(question, new_excerpts="", computed_results=""):
+    """Builds a conversation turn: only the question and anything it newly needs."""
+    excerpts = f"""
+Further excerpts from the document relevant to this question, each labelled with its page number:
+```
+{new_excerpts}
+```
+""" if new_excerpts else ""
+    return f"""{excerpts}{computed_results}
+Answer this question about the document, following the instructions above (including the optional JSON chart block first).
+
+Question: "{question}"
+"""
+
+
+# --- Responses ---
+
+# Function to extract JSON from LLM response
+def extract_chart_json(response_text):
+    match = CHART_JSON_PATTERN.search(response_text)
+    if match:
+        try:
+            chart_spec = json.loads(match.group(1))
+            return chart_spec
+        except json.JSONDecodeError:
+            print("Error decoding JSON from LLM response.")
+            return None
+    return None
+
+
+def strip_chart_json(response_text):
+    """Returns the response text with the chart spec block removed."""
+    return CHART_JSON_PATTERN.sub('', response_text).strip()
+
+
+class InsightStream:
+    """Accumulates a streamed response and splits it into chart spec and prose.
+
+    The chart spec is parsed as soon as its closing fence arrives, so the chart
+    can be drawn while the rest of the answer is still being generated.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.chart_spec = None
+        self.chart_done = False
+
+    def feed(self, chunk):
+        """Adds a chunk of response text. Returns True when the chart spec has just completed."""
+        self.text += chunk
+        if self.chart_done or '```json' not in self.text:
+            return False
+        match = CHART_JSON_PATTERN.search(self.text)
+        if not match:
+            return False
+        self.chart_done = True
+        self.chart_spec = extract_chart_json(match.group(0))
+        return self.chart_spec is not None
+
+    def prose(self):
+        """Returns the prose received so far, hiding a chart spec block that is still open."""
+        text = CHART_JSON_PATTERN.sub('', self.text)
+        open_block = text.find('```json')
+        return (text if open_block == -1 else text[:open_block]).strip()
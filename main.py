@@ -1,12 +1,39 @@
 import os
-import pandas as pd
+import time
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 import json
-import re
-import altair as alt
-import pdfplumber # For PDF text extraction
+from response_cache import ResponseCache, file_digest, make_cache_key
+from query_plan import QueryPlanError
+from charts import ChartSpecError, build_chart
+from metrics import MetricsRecorder, estimate_tokens, start_metrics_server
+from pdf_tables import describe_pages
+from conversation import DocumentConversation, gemini_context_cache
+from dataset_store import DatasetStore
+from insight import ( # Streamlit-free pipeline shared with the batch CLI
+    GEMINI_MODEL_NAME,
+    PROMPT_TEMPLATE_VERSION,
+    DocumentError,
+    InsightStream,
+    build_conversation_context,
+    build_conversation_plan_prompt,
+    build_document_state,
+    build_followup_context,
+    build_insight_prompt,
+    build_plan_prompt,
+    build_turn_prompt,
+    format_computed_results,
+    load_document,
+    new_pdf_excerpts,
+    pdf_context_chunks,
+    run_query_plan,
+    select_chart_data,
+    select_llm_data,
+    strip_chart_json,
+)
+
+# Timed from the top so the metrics panel can report full script reruns
+SCRIPT_START = time.perf_counter()
 
 # --- Configuration ---
 st.set_page_config(
@@ -23,69 +50,459 @@ if not GEMINI_API_KEY:
     st.error("Gemini API Key not found. Please set it in your .env file.")
     st.stop()
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Response cache settings (optional, in .env)
+CACHE_DIR = os.getenv("INSIGHT_CACHE_DIR", ".insight_cache")
+RESPONSE_CACHE_MAX_MB = int(os.getenv("INSIGHT_RESPONSE_CACHE_MB", "256"))
+RESPONSE_CACHE_TTL_HOURS = float(os.getenv("INSIGHT_RESPONSE_CACHE_TTL_HOURS", "168"))
+FRAME_CACHE_DIR = os.path.join(CACHE_DIR, "frames")
+
+# Maximum points/marks sent to the browser per chart (optional, in .env)
+CHART_POINT_BUDGET = int(os.getenv("INSIGHT_CHART_POINTS", "2000"))
+
+# Stage timing log, and an optional local Prometheus endpoint (optional, in .env)
+METRICS_LOG_PATH = os.getenv("INSIGHT_METRICS_LOG", os.path.join(CACHE_DIR, "metrics.jsonl"))
+METRICS_PORT = os.getenv("INSIGHT_METRICS_PORT")
+
+# Memory ceiling for loaded documents shared by all sessions (optional, in .env)
+DATASET_STORE_MAX_MB = int(os.getenv("INSIGHT_DATASET_STORE_MB", "2048"))
+
+# Chat history kept in conversation mode, in estimated tokens (optional, in .env)
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("INSIGHT_CONVERSATION_TOKENS", "32000"))
+# Lifetime of a conversation's document context in Gemini's context cache (optional, in .env)
+CONTEXT_CACHE_MINUTES = float(os.getenv("INSIGHT_CONTEXT_CACHE_MINUTES", "60"))
 
 # --- Helper Functions ---
-@st.cache_data(show_spinner=False)
-def load_data(uploaded_file):
-    """Loads CSV, Excel, or PDF text content into a DataFrame."""
-    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-    try:
-        if file_extension == '.csv':
-            df = pd.read_csv(uploaded_file)
-        elif file_extension in ('.xlsx', '.xls'):
-            df = pd.read_excel(uploaded_file)
-        elif file_extension == '.pdf':
-            with st.spinner("Extracting text from PDF... This may take a moment."):
-                uploaded_file.seek(0) # Ensure file pointer is at the beginning
-                all_text = ""
-                with pdfplumber.open(uploaded_file) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            all_text += page_text + "\n\n" # Add line breaks between pages
-
-                if all_text.strip():
-                    # Create a DataFrame with the extracted text
-                    df = pd.DataFrame({"text_content": [all_text.strip()]})
-                    st.success("Successfully extracted text from PDF.")
-                else:
-                    st.error("No readable text could be extracted from the PDF. It might be an image-based PDF or corrupted.")
-                    return None
+def load_data(uploaded_file, file_hash, file_extension):
+    """Loads CSV, Excel, or PDF text content (one row per page) into the shared dataset store.
+
+    Returns a handle to the stored frame, or None if the file could not be
+    loaded. Sessions opening the same file share one copy, and the file is
+    only parsed if it is in neither the store nor the on-disk frame cache.
+    """
+    def parse():
+        if file_extension == '.pdf':
+            progress = st.progress(0.0, text="Extracting text from PDF... This may take a moment.")
+            preview = st.empty()
+            preview_text = ""
+
+            # Pages stream in from the extraction pool; one row is kept per page
+            # instead of concatenating the whole document into a single string.
+            def show_page(page_number, page_count, page_text):
+                nonlocal preview_text
+                if page_text and len(preview_text) < 500:
+                    preview_text += page_text + "\n\n"
+                    preview.text_area("Extracted Text Preview", preview_text[:500], height=150, disabled=True)
+                progress.progress(page_number / page_count, text=f"Extracted page {page_number} of {page_count}")
+
+            with get_metrics().span("pdf_extraction", trigger="upload", payload_bytes=uploaded_file.size) as span:
+                df = load_document(uploaded_file.getvalue(), file_extension, file_hash, FRAME_CACHE_DIR, on_page=show_page)
+                span["pages"] = len(df)
+            progress.empty()
+            preview.empty()
+            st.success("Successfully extracted text from PDF.")
         else:
-            st.error("Unsupported file type. Please upload a CSV, XLSX, XLS, or PDF file.")
-            return None
+            # Parsed tables are cached on disk as Feather and memory-mapped on reload.
+            with get_metrics().span("table_ingest", trigger="upload", payload_bytes=uploaded_file.size) as span:
+                df = load_document(uploaded_file.getvalue(), file_extension, file_hash, FRAME_CACHE_DIR)
+                span["rows"] = len(df)
         return df
+
+    try:
+        return get_dataset_store().load(file_hash, file_extension, parse)
+    except DocumentError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Error loading file: {e}. Please ensure it's a valid CSV, Excel, or readable PDF file.")
         return None
 
 @st.cache_resource(show_spinner=False)
 def get_gemini_model():
-    """Initializes and returns the Gemini model."""
+    """Configures the Gemini client and returns the model, once per process."""
+    # The SDK is slow to import, so it is only loaded when the first question is asked.
+    import google.generativeai as genai
     try:
-        return genai.GenerativeModel(model_name="models/gemini-1.5-flash")
+        genai.configure(api_key=GEMINI_API_KEY)
+        return genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
     except Exception as e:
         st.error(f"Error initializing Gemini model: {e}")
         return None
 
-# Function to extract JSON from LLM response
-def extract_chart_json(response_text):
-    match = re.search(r'```json\n({.*?})\n```', response_text, re.DOTALL)
-    if match:
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    """Returns the process-wide metrics recorder, starting the /metrics endpoint if configured."""
+    recorder = MetricsRecorder(METRICS_LOG_PATH)
+    if METRICS_PORT:
         try:
-            chart_spec = json.loads(match.group(1))
-            return chart_spec
-        except json.JSONDecodeError:
-            print("Error decoding JSON from LLM response.")
+            start_metrics_server(recorder, int(METRICS_PORT))
+        except (OSError, ValueError) as e:
+            print(f"Could not start metrics endpoint on port {METRICS_PORT}: {e}")
+    return recorder
+
+@st.cache_resource(show_spinner=False)
+def get_dataset_store():
+    """Returns the process-wide store of loaded documents, shared by all sessions."""
+    return DatasetStore(FRAME_CACHE_DIR, max_bytes=DATASET_STORE_MAX_MB * 1024 * 1024)
+
+def get_document_state(dataset):
+    """Returns the document's retrieval index, profile and PDF tables, computed once and shared by all sessions."""
+    return dataset.derived("document_state", lambda df: build_document_state(df, dataset.extension))
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    """Returns the disk-backed response cache shared by all sessions."""
+    return ResponseCache(
+        os.path.join(CACHE_DIR, "responses.sqlite3"),
+        max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds=RESPONSE_CACHE_TTL_HOURS * 3600,
+    )
+
+def cache_document_context(model, context):
+    """Puts a conversation's document context in Gemini's context cache and returns a model bound to it."""
+    return gemini_context_cache(model, context, ttl_seconds=CONTEXT_CACHE_MINUTES * 60)
+
+def generate_with_cache(prompt, payload, question, on_chunk=None, stage="gemini_answer", conversation=None, with_history=True):
+    """Returns the model's response text, served from the response cache when possible.
+
+    If on_chunk is given, the response is streamed and on_chunk is called with
+    each piece of text as it arrives (a cache hit arrives as a single piece).
+    If a conversation is given, the prompt is sent against its document context
+    and (with_history) after its kept history.
+    """
+    response_cache = get_response_cache()
+    cache_key = make_cache_key(st.session_state.file_digest, PROMPT_TEMPLATE_VERSION, payload, question, GEMINI_MODEL_NAME)
+    history_tokens, overhead_tokens = 0, 0
+    if conversation is not None:
+        history_tokens = conversation.history_tokens() if with_history else 0
+        overhead_tokens = conversation.overhead_tokens(with_history)
+    with get_metrics().span(stage, trigger="user", payload_bytes=len(prompt.encode("utf-8")),
+                            prompt_tokens=estimate_tokens(prompt) + overhead_tokens, history_tokens=history_tokens) as span:
+        response_text = response_cache.get(cache_key)
+        span["cache_hit"] = response_text is not None
+        if response_text is not None:
+            if on_chunk:
+                on_chunk(response_text)
+            span["response_tokens"] = estimate_tokens(response_text)
+            return response_text
+
+        model = get_gemini_model()
+        if not model:
             return None
-    return None
+
+        def send(stream=False):
+            if conversation is not None:
+                return conversation.send(model, prompt, stream=stream, with_history=with_history)
+            return model.generate_content(prompt, stream=stream)
+
+        start = time.perf_counter()
+        if on_chunk is None:
+            response = send()
+            response_text = response.text
+            usage = getattr(response, "usage_metadata", None)
+        else:
+            chunks = []
+            usage = None
+            for chunk in send(stream=True):
+                if not chunks:
+                    span["first_chunk_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                chunks.append(chunk.text)
+                on_chunk(chunk.text)
+                # The final chunk carries the usage totals for the whole response.
+                usage = getattr(chunk, "usage_metadata", None) or usage
+            response_text = "".join(chunks)
+        span["prompt_tokens"] = getattr(usage, "prompt_token_count", None) or span["prompt_tokens"]
+        if conversation is not None:
+            span["context_cached"] = conversation.cached_model is not None
+            span["cached_tokens"] = getattr(usage, "cached_content_token_count", None) or 0
+        span["response_tokens"] = getattr(usage, "candidates_token_count", None) or estimate_tokens(response_text)
+        response_cache.set(cache_key, response_text)
+        return response_text
+
+def render_chart(df, chart_spec, file_extension, pdf_tables=None):
+    """Validates a chart spec against the data and renders it with Altair.
+
+    For PDFs, a spec naming one of the extracted tables is drawn from that table.
+    """
+    # For PDFs that are text-based, the dataframe might only have 'text_content' column.
+    # Charting will only work if the LLM *invented* relevant columns
+    # or if the text had embedded tables that pdfplumber missed but LLM could parse.
+    # This is a complex scenario, but we try to handle it gracefully.
+
+    try:
+        st.write("Here is a visualization based on your query:")
+        x_column = chart_spec.get('x_column')
+        y_column = chart_spec.get('y_column')
+        df, table_name = select_chart_data(df, chart_spec, pdf_tables)
+
+        if table_name:
+            st.caption(f"Computed from {table_name}, extracted from {describe_pages(df.attrs['pages'])} of the PDF.")
+        # For text-based PDFs, charting is highly experimental and relies on LLM
+        # correctly inferring or structuring data from prose.
+        # If the AI suggests a chart for a text PDF, we'll try to generate it,
+        # but warn the user that it's experimental.
+        elif file_extension == '.pdf':
+            st.warning("Chart generation for purely text-based PDFs is experimental and relies on the AI inferring structured data from text. It may not always work as expected, especially if data is not explicitly tabular.")
+            # To make charts work reliably for text PDFs, the LLM would need to
+            # output the *data* in a structured format (e.g., a small CSV string)
+            # which we then parse into a temporary DataFrame for Altair.
+            # This current implementation attempts to use the main `df`, which for PDFs
+            # only contains `text_content`. So, unless the LLM suggests `x_column` as
+            # 'text_content' (e.g., for character counts), it won't find the columns.
+            # For now, if the LLM suggests columns not in the DF, it will fall back to text.
+
+        # IMPORTANT: Check if columns exist in the DataFrame *before* trying to plot.
+        # This is crucial for both tabular and inferred-from-text data.
+        chart_valid = True
+        if x_column and x_column not in df.columns:
+            st.warning(f"Chart: X-axis column '{x_column}' not found in data. Skipping chart generation.")
+            chart_valid = False
+        if y_column and y_column not in df.columns:
+            st.warning(f"Chart: Y-axis column '{y_column}' not found in data. Skipping chart generation.")
+            chart_valid = False
+
+        if chart_spec and chart_valid and x_column: # Proceed only if spec is valid and columns exist
+            # Data is aggregated/downsampled server-side so the browser payload stays small.
+            with get_metrics().span("chart_render", trigger="user", chart_type=chart_spec.get('chart_type')) as span:
+                try:
+                    chart, chart_note = build_chart(df, chart_spec, max_points=CHART_POINT_BUDGET)
+                except ChartSpecError as spec_e:
+                    st.warning(str(spec_e))
+                    span["error"] = str(spec_e)
+                    chart, chart_note = None, None
+
+                if chart:
+                    span["chart_points"] = len(chart.data)
+                    st.altair_chart(chart, use_container_width=True)
+                    if chart_note:
+                        st.caption(chart_note)
+                else:
+                    # If chart_spec was valid but chart couldn't be built (e.g., specific Altair error)
+                    st.warning("Could not generate chart with the provided specifications. Please try refining your question.")
+
+    except Exception as chart_e:
+        st.error(f"An unexpected error occurred during chart generation: {chart_e}")
+        st.info("The AI might have suggested an incompatible chart or columns for the current data. Please refine your question.")
+
+def build_preview(df, file_extension):
+    """Returns the document preview: leading PDF text, or the first rows of a table."""
+    if file_extension == '.pdf':
+        if 'text_content' in df.columns and not df['text_content'].empty:
+            return "\n\n".join(df.loc[df['text_content'] != '', 'text_content'].head(5))[:500] + "..."
+        return None
+    return df.head(10)
+
+def answer_question(dataset, question, conversation=None):
+    """Runs the question pipeline and renders the streamed answer and chart.
+
+    In a conversation, the document context is prepared once, for the first
+    question; every turn then sends only the question (plus new excerpts or
+    computed results) against that context, or against the document's
+    outline when the context could not be cached.
+    """
+    try:
+        df = dataset.frame()
+        file_extension = dataset.extension
+        document_state = get_document_state(dataset)
+        followup = conversation is not None and bool(conversation.turns)
+        # --- Dynamic Data Sample for Prompt ---
+        # A conversation reuses the document context prepared for its first question.
+        data_for_llm, data_format_desc = "", None
+        if conversation is None or not conversation.started:
+            try:
+                with get_metrics().span("context_select", trigger="user"):
+                    data_for_llm, data_format_desc = select_llm_data(
+                        df, file_extension, question, document_state["pdf_index"], document_state["profile_text"],
+                        document_state["pdf_tables"],
+                    )
+            except DocumentError as data_e:
+                st.error(str(data_e))
+                return # Stop if data is not available for PDF
+
+            if data_for_llm is None: # Double-check if data_for_llm was set
+                st.error("Failed to prepare data for AI analysis.")
+                return
+
+            if conversation is not None:
+                context_chunks = []
+                if file_extension == '.pdf':
+                    context_chunks = pdf_context_chunks(df, question, document_state["pdf_index"])
+                conversation.start(
+                    build_conversation_context(data_for_llm, data_format_desc, file_extension), context_chunks,
+                    build_followup_context(file_extension, document_state["profile_summary"], document_state["pdf_tables"]),
+                )
+
+        # --- Exact figures for tabular data ---
+        # Gemini plans the computation from the profile; pandas runs it over every row.
+        query_plan, query_result = None, None
+        computed_results = ""
+        if file_extension != '.pdf':
+            earlier_questions = [turn["question"] for turn in conversation.kept_turns()] if conversation is not None else []
+            model = get_gemini_model()
+            if conversation is not None and model and conversation.context_cached(model):
+                # The profile is already in the conversation's cached context, so it is not sent again.
+                plan_prompt = build_conversation_plan_prompt(question, earlier_questions)
+                def generate_plan(prompt, payload):
+                    return generate_with_cache(prompt, conversation.cache_payload(prompt, with_history=False), question,
+                                               stage="gemini_plan", conversation=conversation, with_history=False)
+            else:
+                # Uncached follow-ups plan from the profile without its sample rows.
+                plan_prompt = None
+                if conversation is not None and conversation.turns:
+                    plan_prompt = build_plan_prompt(document_state["profile_summary"], question, earlier_questions)
+                def generate_plan(prompt, payload):
+                    return generate_with_cache(prompt, payload, question, stage="gemini_plan")
+            try:
+                with get_metrics().span("query_plan", trigger="user"):
+                    query_plan, query_result = run_query_plan(
+                        df, question, document_state["profile_text"], generate_plan, plan_prompt,
+                    )
+            except QueryPlanError as plan_e:
+                st.caption(f"Could not compute exact figures for this question: {plan_e}")
+            except Exception as plan_e:
+                # Exact figures are an extra: the answer still comes from the profile alone.
+                print(f"Query plan stage failed: {plan_e!r}")
+                query_plan, query_result = None, None
+                st.caption("Could not compute exact figures for this question; the answer is based on the dataset profile.")
+            if query_result is not None:
+                computed_results = format_computed_results(len(df), query_plan, query_result)
+
+        model = get_gemini_model()
+        if model:
+            sent_chunks = []
+            with get_metrics().span("prompt_build", trigger="user", followup=followup):
+                if conversation is not None:
+                    new_excerpts = ""
+                    if file_extension == '.pdf':
+                        new_excerpts, sent_chunks = new_pdf_excerpts(
+                            question, document_state["pdf_index"], conversation.sent_chunks()
+                        )
+                    prompt = build_turn_prompt(question, new_excerpts, computed_results)
+                else:
+                    prompt = build_insight_prompt(data_for_llm, data_format_desc, question, file_extension, computed_results)
+            st.subheader("Your Insight")
+            if query_result is not None:
+                with st.expander(f"Exact results computed over all {len(df)} rows"):
+                    st.dataframe(query_result, use_container_width=True)
+                    st.code(json.dumps(query_plan, indent=2), language="json")
+
+            # The answer streams in: the chart renders as soon as its JSON block
+            # closes, and the prose below it updates with every chunk.
+            chart_area = st.container()
+            answer_area = st.empty()
+            insight_stream = InsightStream()
+
+            def show_chunk(chunk):
+                if insight_stream.feed(chunk):
+                    with chart_area:
+                        render_chart(df, insight_stream.chart_spec, file_extension, document_state["pdf_tables"])
+                answer_area.markdown(insight_stream.prose() + " ▌")
+
+            if conversation is not None:
+                full_response_text = generate_with_cache(
+                    prompt, conversation.cache_payload(prompt), question, on_chunk=show_chunk,
+                    stage="gemini_followup" if followup else "gemini_answer", conversation=conversation,
+                ) or ""
+                if full_response_text:
+                    conversation.record(question, prompt, full_response_text, sent_chunks)
+            else:
+                full_response_text = generate_with_cache(
+                    prompt, data_for_llm + computed_results, question, on_chunk=show_chunk
+                ) or ""
+            chart_spec = insight_stream.chart_spec
+            cleaned_response_text = strip_chart_json(full_response_text)
+
+            if cleaned_response_text:
+                answer_area.markdown(cleaned_response_text)
+            elif not chart_spec: # If no chart and no text, something went wrong
+                answer_area.warning("The AI did not provide a textual insight or a valid chart specification.")
+            else:
+                answer_area.empty()
+
+    except Exception as e:
+        st.error(f"An error occurred during AI generation: {e}")
+        st.info("Please try rephrasing your question or check the console for details.")
+
+# Fragments rerun on their own when their widgets change, so typing a question
+# or asking for an insight never reloads the file or redraws the preview.
+@st.fragment
+def question_panel(dataset):
+    """Question box, Get Insight button, chart and answer."""
+    with get_metrics().span("question_panel") as span:
+        st.subheader("Ask a Question About Your Document") # Updated subheader
+
+        col1, col2 = st.columns([0.8, 0.2])
+
+        with col1:
+            st.text_input(
+                "What do you want to know about your document?", # Updated prompt
+                placeholder="e.g., 'Summarize the document', 'What are the key responsibilities mentioned?', 'If this were tabular data, what would be the average of [column]?', 'Can you find a bar chart for [category] if present?'",
+                key="user_question",
+                label_visibility="collapsed"
+            )
+
+        with col2:
+            def clear_query():
+                st.session_state.user_question = ""
+            st.button("Clear Query", on_click=clear_query, help="Clear the current question", type="secondary")
+
+        st.toggle(
+            "Conversation mode",
+            key="conversation_mode",
+            help="Follow-up questions continue a chat about this document. The document goes with the first question only; follow-ups send its outline, the recent exchange and just the excerpts or exact figures they need.",
+        )
+        conversation = None
+        if st.session_state.conversation_mode:
+            if st.session_state.get("conversation") is None:
+                st.session_state.conversation = DocumentConversation(CONVERSATION_TOKEN_BUDGET, cache_context=cache_document_context)
+            conversation = st.session_state.conversation
+            for turn in conversation.turns:
+                with st.chat_message("user"):
+                    st.markdown(turn["question"])
+                with st.chat_message("assistant"):
+                    st.markdown(strip_chart_json(turn["answer"]))
+            if conversation.turns:
+                def new_conversation():
+                    st.session_state.conversation = None
+                st.button("New conversation", on_click=new_conversation, type="secondary")
+
+        question = st.session_state.user_question
+
+        if st.button("Get Insight", type="primary"):
+            span["trigger"] = "user"
+            if question:
+                with st.spinner("Generating insights and visualizations with Gemini..."):
+                    answer_question(dataset, question, conversation)
+            else:
+                st.warning("Please enter a question to get insights!")
+
+@st.fragment
+def metrics_panel():
+    """Response cache counters and per-stage timings for the sidebar."""
+    cache_stats = get_response_cache().stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} stored")
+    store_stats = get_dataset_store().stats()
+    st.caption(
+        f"Dataset store: {store_stats['entries']} documents, {store_stats['bytes'] / 1024 ** 2:.1f} of "
+        f"{store_stats['max_bytes'] / 1024 ** 2:.0f} MB, {store_stats['evictions']} evicted"
+    )
+    with st.expander("Performance metrics"):
+        st.button("Refresh", key="refresh_metrics", help="Questions rerun on their own, so this panel refreshes separately")
+        metrics_summary = get_metrics().summary()
+        st.dataframe(
+            [{"stage": stage, **stats} for stage, stats in metrics_summary.items()],
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.caption("Recent spans (all sessions)")
+        st.dataframe(list(reversed(get_metrics().recent(20))), hide_index=True, use_container_width=True)
 
 # --- Initialize Session State ---
 if 'user_question' not in st.session_state:
     st.session_state.user_question = ""
 if 'uploaded_file_name' not in st.session_state:
     st.session_state.uploaded_file_name = None
+if 'conversation_mode' not in st.session_state:
+    st.session_state.conversation_mode = False
 
 # --- Streamlit UI ---
 
@@ -123,239 +540,66 @@ uploaded_file = st.file_uploader(
     help="Supported formats: CSV, XLSX, XLS (for tabular data), PDF (for text or tables)."
 )
 
+rerun_trigger = "rerun" # What caused this script run, for the metrics panel
+
 if uploaded_file:
-    if "df" not in st.session_state or st.session_state.uploaded_file_name != uploaded_file.name:
-        st.session_state.df = load_data(uploaded_file)
+    if "dataset" not in st.session_state or st.session_state.uploaded_file_name != uploaded_file.name:
+        rerun_trigger = "upload"
+        # Everything derived from the file is computed here, once per upload.
+        file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+        st.session_state.file_digest = file_digest(uploaded_file.getvalue())
+        # The session keeps a handle; the frame itself lives in the shared store.
+        with get_metrics().span("file_load", trigger="upload", payload_bytes=uploaded_file.size):
+            st.session_state.dataset = load_data(uploaded_file, st.session_state.file_digest, file_extension)
         st.session_state.uploaded_file_name = uploaded_file.name
         st.session_state.user_question = ""
-
-    df = st.session_state.df
-
-    if df is not None:
+        st.session_state.preview = None
+        st.session_state.conversation = None # A new document starts a new conversation
+        if st.session_state.dataset is not None:
+            # Build the PDF retrieval index or the table profile once per document;
+            # every question (from any session) reuses it instead of sending the raw content.
+            with st.spinner("Indexing document..."), get_metrics().span("index", trigger="upload"):
+                get_document_state(st.session_state.dataset)
+            st.session_state.preview = build_preview(st.session_state.dataset.frame(), file_extension)
+
+    dataset = st.session_state.dataset
+    preview = st.session_state.preview
+
+    if dataset is not None:
+        df = dataset.frame()
+        file_extension = dataset.extension
+        pdf_tables = get_document_state(dataset)["pdf_tables"]
         st.success("File loaded successfully!")
 
         # Dynamic preview based on file type
-        file_extension = os.path.splitext(uploaded_file.name)[1].lower()
         if file_extension == '.pdf':
             st.markdown("### PDF Text Content (First 500 characters)")
             # Displaying first 500 characters of the extracted text for PDF
-            if 'text_content' in df.columns and not df['text_content'].empty:
-                st.text_area("Extracted Text Preview", df['text_content'].iloc[0][:500] + "...", height=150, disabled=True)
+            if preview is not None:
+                st.text_area("Extracted Text Preview", preview, height=150, disabled=True)
+                st.caption(f"Extracted {len(df)} pages.")
                 st.info("Full PDF text content has been loaded for analysis.")
             else:
                 st.warning("No text content available for preview.")
+            if pdf_tables:
+                with st.expander(f"Tables extracted from the PDF ({len(pdf_tables)})"):
+                    for table_name, table in pdf_tables.items():
+                        st.caption(f"**{table_name}** ({describe_pages(table.attrs['pages'])}, {len(table)} rows)")
+                        st.dataframe(table.head(10), use_container_width=True)
         else:
             with st.expander("Click to view Dataset Preview (first 10 rows)"):
-                st.dataframe(df.head(10), use_container_width=True)
+                st.dataframe(preview, use_container_width=True)
                 st.info(f"Dataset has **{df.shape[0]} rows** and **{df.shape[1]} columns**.")
 
-        # Question Input Section
-        st.subheader("Ask a Question About Your Document") # Updated subheader
-
-        col1, col2 = st.columns([0.8, 0.2])
-
-        with col1:
-            st.text_input(
-                "What do you want to know about your document?", # Updated prompt
-                placeholder="e.g., 'Summarize the document', 'What are the key responsibilities mentioned?', 'If this were tabular data, what would be the average of [column]?', 'Can you find a bar chart for [category] if present?'",
-                key="user_question",
-                label_visibility="collapsed"
-            )
-
-        with col2:
-            def clear_query():
-                st.session_state.user_question = ""
-            st.button("Clear Query", on_click=clear_query, help="Clear the current question", type="secondary")
-
-        question = st.session_state.user_question
-
-        if st.button("Get Insight", type="primary"):
-            if question:
-                with st.spinner("Generating insights and visualizations with Gemini..."):
-                    try:
-                        # --- Dynamic Data Sample for Prompt ---
-                        file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-                        data_for_llm = None # Initialize to None
-
-                        if file_extension == '.pdf':
-                            if 'text_content' in df.columns and not df['text_content'].empty:
-                                data_for_llm = df['text_content'].iloc[0]
-                                data_format_desc = "text content from the document"
-                            else:
-                                st.error("Could not find text content in the DataFrame for PDF analysis. Cannot proceed with AI analysis.")
-                                st.stop() # Stop execution if data is not available for PDF
-                        else: # CSV or Excel
-                            data_for_llm = df.sample(min(20, len(df))).to_csv(index=False) if len(df) > 20 else df.to_csv(index=False)
-                            data_format_desc = "sample of the dataset, formatted as a CSV string"
-
-                        if data_for_llm is None: # Double-check if data_for_llm was set
-                            st.error("Failed to prepare data for AI analysis.")
-                            st.stop()
-
-                        model = get_gemini_model()
-                        if model:
-                            # Adjust chart instruction based on data type
-                            chart_instruction = ""
-                            if file_extension != '.pdf': # Only give detailed chart instructions for tabular data
-                                chart_instruction = """
-                                If a data visualization is appropriate for the question, first output a JSON object with the chart specifications.
-                                If the chart type is not explicitly requested, infer the most suitable chart type from the question and data.
-                                The JSON should be enclosed in triple backticks and `json` tag like this:
-                                ```json
-                                {{
-                                  "chart_type": "bar" | "line" | "scatter" | "histogram",
-                                  "x_column": "column_name",
-                                  "y_column": "column_name" | null,
-                                  "aggregation": "sum" | "average" | "count" | null,
-                                  "title": "Chart Title (Optional)"
-                                }}
-                                ```
-                                Valid `chart_type` values are "bar", "line", "scatter", "histogram".
-                                - For "bar" charts, `x_column` is typically categorical and `y_column` (if provided) is quantitative for aggregation. If `y_column` is null, assume count.
-                                - For "line" charts, `x_column` is typically temporal or ordinal, and `y_column` is quantitative.
-                                - For "scatter" charts, both `x_column` and `y_column` are quantitative.
-                                - For "histogram" charts, only `x_column` is needed (quantitative). `y_column` and `aggregation` should be null.
-                                Ensure column names in JSON exactly match those in the dataset.
-                                If no chart is suitable, do not include the JSON block.
-
-                                After the JSON (if present),
-                                """
-                            else: # For PDF text, charts are less likely, still allow if inferable
-                                chart_instruction = """
-                                If the question implies a visualization of structured (e.g., numerical or categorical) data that can be inferred from the text, first output a JSON object with the chart specifications. Otherwise, do not include a JSON block.
-                                The JSON should follow the same format as for tabular data.
-                                Use column names that best represent the inferred data. If no chart is suitable, do not include the JSON block.
-
-                                After the JSON (if present),
-                                """
-
-
-                            prompt = f"""
-                            You are an expert data analyst and document summarizer. Below is the {data_format_desc}:
-                            ```
-                            {data_for_llm}
-                            ```
-
-                            Based on this content, please perform the requested analysis.
-                            {chart_instruction}
-                            Provide a comprehensive explanation and analysis in natural language, including how the answer was derived from the content and any relevant context or limitations (e.g., if analyzing text, note it's based on inferred data).
-                            Do not provide any code outside of the specified JSON block (if applicable).
-
-                            Question: "{question}"
-                            """
-                            response = model.generate_content(prompt)
-                            full_response_text = response.text
-
-                            chart_spec = extract_chart_json(full_response_text)
-                            cleaned_response_text = re.sub(r'```json\n({.*?})\n```', '', full_response_text, flags=re.DOTALL).strip()
-
-
-                            st.subheader("Your Insight")
-                            if chart_spec:
-                                # For PDFs that are text-based, the dataframe might only have 'text_content' column.
-                                # Charting will only work if the LLM *invented* relevant columns
-                                # or if the text had embedded tables that pdfplumber missed but LLM could parse.
-                                # This is a complex scenario, but we try to handle it gracefully.
-
-                                try:
-                                    st.write("Here is a visualization based on your query:")
-                                    chart_type = chart_spec.get('chart_type')
-                                    x_column = chart_spec.get('x_column')
-                                    y_column = chart_spec.get('y_column')
-                                    aggregation = chart_spec.get('aggregation')
-                                    chart_title = chart_spec.get('title') or f"{x_column} vs {y_column if y_column else 'Count'}"
-
-                                    # For text-based PDFs, charting is highly experimental and relies on LLM
-                                    # correctly inferring or structuring data from prose.
-                                    # If the AI suggests a chart for a text PDF, we'll try to generate it,
-                                    # but warn the user that it's experimental.
-                                    if file_extension == '.pdf':
-                                        st.warning("Chart generation for purely text-based PDFs is experimental and relies on the AI inferring structured data from text. It may not always work as expected, especially if data is not explicitly tabular.")
-                                        # To make charts work reliably for text PDFs, the LLM would need to
-                                        # output the *data* in a structured format (e.g., a small CSV string)
-                                        # which we then parse into a temporary DataFrame for Altair.
-                                        # This current implementation attempts to use the main `df`, which for PDFs
-                                        # only contains `text_content`. So, unless the LLM suggests `x_column` as
-                                        # 'text_content' (e.g., for character counts), it won't find the columns.
-                                        # For now, if the LLM suggests columns not in the DF, it will fall back to text.
-
-                                    # IMPORTANT: Check if columns exist in the DataFrame *before* trying to plot.
-                                    # This is crucial for both tabular and inferred-from-text data.
-                                    chart_valid = True
-                                    if x_column and x_column not in df.columns:
-                                        st.warning(f"Chart: X-axis column '{x_column}' not found in data. Skipping chart generation.")
-                                        chart_valid = False
-                                    if y_column and y_column not in df.columns:
-                                        st.warning(f"Chart: Y-axis column '{y_column}' not found in data. Skipping chart generation.")
-                                        chart_valid = False
-
-                                    if chart_spec and chart_valid and x_column: # Proceed only if spec is valid and columns exist
-                                        chart = None
-                                        if chart_type == "bar":
-                                            if y_column and aggregation:
-                                                chart = alt.Chart(df).mark_bar().encode(
-                                                    x=alt.X(x_column, type='nominal'),
-                                                    y=alt.Y(f'{aggregation}({y_column})', title=f'{aggregation.capitalize()} of {y_column}'),
-                                                    tooltip=[x_column, alt.Tooltip(f'{aggregation}({y_column})')]
-                                                ).properties(title=chart_title)
-                                            else:
-                                                chart = alt.Chart(df).mark_bar().encode(
-                                                    x=alt.X(x_column, type='nominal'),
-                                                    y=alt.Y('count()', title='Count of Records'),
-                                                    tooltip=[x_column, 'count()']
-                                                ).properties(title=chart_title)
-                                        elif chart_type == "line" and y_column:
-                                            x_type = 'quantitative' if pd.api.types.is_numeric_dtype(df[x_column]) else 'nominal'
-                                            y_type = 'quantitative' if pd.api.types.is_numeric_dtype(df[y_column]) else 'nominal'
-                                            chart = alt.Chart(df).mark_line().encode(
-                                                x=alt.X(x_column, type=x_type),
-                                                y=alt.Y(y_column, type=y_type),
-                                                tooltip=[x_column, y_column]
-                                            ).properties(title=chart_title)
-                                        elif chart_type == "scatter" and y_column:
-                                            x_type = 'quantitative' if pd.api.types.is_numeric_dtype(df[x_column]) else 'nominal'
-                                            y_type = 'quantitative' if pd.api.types.is_numeric_dtype(df[y_column]) else 'nominal'
-                                            chart = alt.Chart(df).mark_point().encode(
-                                                x=alt.X(x_column, type=x_type),
-                                                y=alt.Y(y_column, type=y_type),
-                                                tooltip=[x_column, y_column]
-                                            ).properties(title=chart_title)
-                                        elif chart_type == "histogram":
-                                            if x_column:
-                                                chart = alt.Chart(df).mark_bar().encode(
-                                                    alt.X(x_column, bin=True, title=x_column),
-                                                    alt.Y('count()', title='Frequency')
-                                                ).properties(title=chart_title)
-                                            else:
-                                                st.warning("Histogram requires an x_column to be specified.")
-                                                chart_spec = None # Invalidate chart
-                                        else:
-                                            st.warning(f"Unsupported chart type or missing required columns for chart: {chart_type}.")
-                                            chart_spec = None # Invalidate chart
-
-                                        if chart:
-                                            st.altair_chart(chart, use_container_width=True)
-                                        else:
-                                            # If chart_spec was valid but chart couldn't be built (e.g., specific Altair error)
-                                            st.warning("Could not generate chart with the provided specifications. Please try refining your question.")
-
-                                except Exception as chart_e:
-                                    st.error(f"An unexpected error occurred during chart generation: {chart_e}")
-                                    st.info("The AI might have suggested an incompatible chart or columns for the current data. Please refine your question.")
-
-                            if cleaned_response_text:
-                                st.markdown(cleaned_response_text)
-                            elif not chart_spec: # If no chart and no text, something went wrong
-                                st.warning("The AI did not provide a textual insight or a valid chart specification.")
-
-
-                    except Exception as e:
-                        st.error(f"An error occurred during AI generation: {e}")
-                        st.info("Please try rephrasing your question or check the console for details.")
-            else:
-                st.warning("Please enter a question to get insights!")
+        question_panel(dataset)
     else:
         st.error("Failed to load DataFrame. Please ensure the file format is correct and it contains valid data.")
 
 else:
     st.info("Upload a CSV, Excel, or PDF file to get started with your document analysis!")
+
+# Rendered last so the counters and timings include this run
+get_metrics().record({"stage": "script_run", "trigger": rerun_trigger,
+                      "duration_ms": round((time.perf_counter() - SCRIPT_START) * 1000, 3)})
+with st.sidebar:
+    metrics_panel()
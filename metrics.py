@@ -0,0 +1,133 @@
+"""Per-stage latency and usage metrics.
+
+Each stage of the pipeline (file loading, PDF extraction, indexing, prompt
+building, Gemini calls, chart rendering) is wrapped in a timing span. A span
+records its duration and any attributes set while it runs (token counts,
+payload bytes, cache hits, what triggered the rerun, errors). Spans are kept
+in memory for percentile summaries, appended to a rotating JSONL log, and can
+optionally be served in Prometheus text format on a local port.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+
+HISTORY_SIZE = 5000
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+# Attributes summed into counters in the Prometheus output.
+COUNTED_ATTRIBUTES = ("prompt_tokens", "response_tokens", "payload_bytes")
+
+
+def estimate_tokens(text):
+    """Approximates a token count (about four characters per token)."""
+    return len(text or "") // 4
+
+
+class MetricsRecorder:
+    """Collects timing spans, keeps recent history, and writes them to a JSONL log."""
+
+    def __init__(self, log_path=None, history=HISTORY_SIZE):
+        self._spans = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._logger = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            self._logger = logging.getLogger(f"insight.metrics.{os.path.abspath(log_path)}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger.addHandler(handler)
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        """Times the enclosed block. Yields a dict the block can add attributes to."""
+        span = {"stage": stage, "trigger": "rerun", **attributes}
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.record(span)
+
+    def record(self, span):
+        """Stores a finished span and appends it to the log."""
+        span.setdefault("timestamp", time.time())
+        with self._lock:
+            self._spans.append(span)
+        if self._logger:
+            self._logger.info(json.dumps(span, default=str))
+
+    def recent(self, limit=50):
+        """Returns the most recent spans, newest last."""
+        with self._lock:
+            return list(self._spans)[-limit:]
+
+    def summary(self):
+        """Returns {stage: {count, p50_ms, p95_ms, errors, cache_hits}} over the recorded history."""
+        with self._lock:
+            spans = list(self._spans)
+        by_stage = {}
+        for span in spans:
+            by_stage.setdefault(span["stage"], []).append(span)
+        summary = {}
+        for stage, stage_spans in sorted(by_stage.items()):
+            durations = np.array([span["duration_ms"] for span in stage_spans])
+            summary[stage] = {
+                "count": len(stage_spans),
+                "p50_ms": float(np.percentile(durations, 50)),
+                "p95_ms": float(np.percentile(durations, 95)),
+                "errors": sum(1 for span in stage_spans if span.get("error")),
+                "cache_hits": sum(1 for span in stage_spans if span.get("cache_hit")),
+            }
+            for attribute in COUNTED_ATTRIBUTES:
+                summary[stage][attribute] = sum(span.get(attribute) or 0 for span in stage_spans)
+        return summary
+
+    def prometheus_text(self):
+        """Renders the summary in the Prometheus text exposition format."""
+        lines = ["# TYPE insight_stage_duration_ms summary"]
+        summary = self.summary()
+        for stage, stats in summary.items():
+            lines.append(f'insight_stage_duration_ms{{stage="{stage}",quantile="0.5"}} {stats["p50_ms"]}')
+            lines.append(f'insight_stage_duration_ms{{stage="{stage}",quantile="0.95"}} {stats["p95_ms"]}')
+            lines.append(f'insight_stage_duration_ms_count{{stage="{stage}"}} {stats["count"]}')
+        for name in ("errors", "cache_hits") + COUNTED_ATTRIBUTES:
+            lines.append(f"# TYPE insight_stage_{name}_total counter")
+            lines.extend(f'insight_stage_{name}_total{{stage="{stage}"}} {stats[name]}' for stage, stats in summary.items())
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(recorder, port, host="127.0.0.1"):
+    """Serves recorder.prometheus_text() at http://host:port/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would otherwise flood the console
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="insight-metrics", daemon=True).start()
+    return server
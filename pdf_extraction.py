@@ -0,0 +1,112 @@
+"""PDF text and table extraction for Project Insight.
+
+Pages are split into contiguous batches and extracted in a process pool, so
+large documents use every available core. Pages are yielded one at a time and
+in order, which lets the UI show progress and a preview while the rest of the
+document is still being processed.
+
+Tables are found with pdfplumber's table finder in the same pass as the text,
+and kept raw (rows of cell strings plus their vertical position on the page);
+pdf_tables.py stitches and types them.
+"""
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Pages handed to a worker in one task. Large enough to amortise the IPC
+# round trip, small enough that progress updates stay smooth.
+PAGES_PER_BATCH = 16
+# Below this many pages the pool start-up cost outweighs the parallel speed-up.
+MIN_PAGES_FOR_POOL = 32
+
+# Each worker process parses the document once and keeps it open for every
+# batch it is given.
+_worker_pdf = None
+
+
+def _open_pdf(pdf_bytes):
+    import pdfplumber  # Imported lazily so worker start-up stays cheap
+    return pdfplumber.open(io.BytesIO(pdf_bytes))
+
+
+def _init_worker(pdf_bytes):
+    global _worker_pdf
+    _worker_pdf = _open_pdf(pdf_bytes)
+
+
+def _extract_tables(page):
+    """Returns the page's tables as {"rows", "top", "bottom"}, positions as fractions of the page height."""
+    # The default table finder works from ruling lines; pages without any cannot contain a table.
+    if not (page.lines or page.rects or page.curves):
+        return []
+    return [
+        {"rows": table.extract(), "top": table.bbox[1] / page.height, "bottom": table.bbox[3] / page.height}
+        for table in page.find_tables()
+    ]
+
+
+def _extract_page(page):
+    text = page.extract_text() or ""
+    tables = _extract_tables(page)
+    page.flush_cache()  # Drop parsed layout objects so memory stays flat
+    return text, tables
+
+
+def _extract_page_range(start, stop):
+    """Extracts pages [start, stop) from the worker's open document."""
+    return [(index + 1, *_extract_page(_worker_pdf.pages[index])) for index in range(start, stop)]
+
+
+def count_pdf_pages(pdf_bytes):
+    """Returns the number of pages in a PDF."""
+    with _open_pdf(pdf_bytes) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(pdf_bytes, page_count, max_workers=None, pages_per_batch=PAGES_PER_BATCH):
+    """Yields (page_number, text, tables) for every page of a PDF, in page order.
+
+    Page numbers are 1-based. Pages without extractable text yield an empty
+    string (and pages without tables an empty list) so callers can still
+    account for them.
+    """
+    workers = min(max_workers or os.cpu_count() or 1, -(-page_count // pages_per_batch))
+    if page_count < MIN_PAGES_FOR_POOL or workers < 2:
+        with _open_pdf(pdf_bytes) as pdf:
+            for index, page in enumerate(pdf.pages):
+                yield index + 1, *_extract_page(page)
+        return
+
+    batches = deque(
+        (start, min(start + pages_per_batch, page_count))
+        for start in range(0, page_count, pages_per_batch)
+    )
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pdf_bytes,)) as executor:
+        # Keep a bounded window of batches in flight so finished-but-unread
+        # results never pile up for the whole document.
+        in_flight = deque()
+        while batches or in_flight:
+            while batches and len(in_flight) < workers * 2:
+                in_flight.append(executor.submit(_extract_page_range, *batches.popleft()))
+            yield from in_flight.popleft().result()
+
+
+def extract_pdf_frame(pdf_bytes, on_page=None):
+    """Extracts a PDF into a DataFrame with one row per page (page, text_content, tables).
+
+    tables holds the raw tables found on each page (see _extract_tables). If
+    given, on_page(page_number, page_count, text) is called as each page
+    arrives, so callers can report progress.
+    """
+    page_count = count_pdf_pages(pdf_bytes)
+    page_numbers, page_texts, page_tables = [], [], []
+    for page_number, page_text, tables in iter_pdf_pages(pdf_bytes, page_count):
+        page_numbers.append(page_number)
+        page_texts.append(page_text.strip())
+        page_tables.append(tables)
+        if on_page:
+            on_page(page_number, page_count, page_texts[-1])
+    return pd.DataFrame({"page": page_numbers, "text_content": page_texts, "tables": page_tables})
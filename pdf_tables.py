@@ -0,0 +1,134 @@
+"""Tables extracted from PDFs, as typed DataFrames.
+
+pdf_extraction.py records the raw tables found on each page. Here they are
+stitched back together when a table runs over a page break, given column
+names from their header row, and typed (numbers, including currency,
+thousands separators, percentages and accounting negatives, and dates), so
+charts for PDFs can be computed from the real extracted values.
+
+A table on one page continues the last table of the previous page when that
+table reached the bottom of its page, the new one starts at the top of the
+next, and both have the same number of columns. A repeated header row on the
+continuation is dropped.
+"""
+import pandas as pd
+
+# A table within this fraction of the page height from the top/bottom edge
+# counts as touching it, for stitching across page breaks.
+PAGE_EDGE_MARGIN = 0.2
+# Share of a column's non-empty cells that must parse for it to be typed.
+MIN_PARSED_SHARE = 0.8
+# Rows per table included in the prompt.
+PROMPT_ROWS = 30
+MAX_PROMPT_TABLES = 10
+
+NUMBER_NOISE_PATTERN = r"[\s,$€£¥₹%]"
+
+
+def _clean_cell(cell):
+    return " ".join(str(cell).split()) if cell is not None else ""
+
+
+def stitch_tables(page_numbers, page_tables):
+    """Returns the logical tables in a document as {"pages", "rows"}, in document order.
+
+    page_tables[i] is the list of raw tables found on page page_numbers[i].
+    """
+    tables = []
+    previous = None  # The last table of the previous page, if it reached the bottom edge
+    for page_number, raw_tables in zip(page_numbers, page_tables):
+        last = None
+        for position, raw in enumerate(raw_tables):
+            rows = [[_clean_cell(cell) for cell in row] for row in raw["rows"]]
+            rows = [row for row in rows if any(row)]
+            if not rows:
+                continue
+            continues = (
+                position == 0
+                and previous is not None
+                and previous["pages"][-1] == page_number - 1
+                and raw["top"] <= PAGE_EDGE_MARGIN
+                and len(rows[0]) == len(previous["rows"][0])
+            )
+            if continues:
+                if rows[0] == previous["rows"][0]:
+                    rows = rows[1:]  # Header repeated on the new page
+                previous["rows"].extend(rows)
+                previous["pages"].append(page_number)
+                last = previous
+            else:
+                last = {"pages": [page_number], "rows": rows}
+                tables.append(last)
+            last["at_bottom"] = raw["bottom"] >= 1 - PAGE_EDGE_MARGIN
+        previous = last if last is not None and last["at_bottom"] else None
+    return tables
+
+
+def _column_names(header):
+    """Returns unique, non-empty column names for a header row."""
+    names, seen = [], {}
+    for index, cell in enumerate(header):
+        name = cell or f"column_{index + 1}"
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+def infer_column_type(values):
+    """Converts a column of cell strings to numbers or dates when nearly all cells parse."""
+    text = values.mask(values == "")
+    present = text.notna().sum()
+    if not present:
+        return text
+    cleaned = (
+        text.str.replace(NUMBER_NOISE_PATTERN, "", regex=True)
+        .str.replace(r"^\((.*)\)$", r"-\1", regex=True)  # (1,200) is an accounting negative
+    )
+    numbers = pd.to_numeric(cleaned, errors="coerce")
+    if numbers.notna().sum() >= MIN_PARSED_SHARE * present:
+        return numbers
+    dates = pd.to_datetime(text, errors="coerce", format="mixed")
+    if dates.notna().sum() >= MIN_PARSED_SHARE * present:
+        return dates
+    return text
+
+
+def table_frame(rows, pages):
+    """Builds a typed DataFrame from table rows whose first row is the header."""
+    width = max(len(row) for row in rows)
+    header, body = rows[0] + [""] * (width - len(rows[0])), rows[1:]
+    frame = pd.DataFrame([row + [""] * (width - len(row)) for row in body], columns=_column_names(header), dtype=object)
+    frame = frame.apply(infer_column_type)
+    frame.attrs["pages"] = pages
+    return frame
+
+
+def build_pdf_tables(df):
+    """Returns {name: DataFrame} for every table in a PDF page frame, named table_1, table_2, ..."""
+    if 'tables' not in df.columns:
+        return {}
+    # A table needs a header and at least one row of data to be useful.
+    tables = [table for table in stitch_tables(df['page'], df['tables']) if len(table["rows"]) > 1]
+    return {
+        f"table_{number}": table_frame(table["rows"], table["pages"])
+        for number, table in enumerate(tables, start=1)
+    }
+
+
+def describe_pages(pages):
+    return f"page {pages[0]}" if len(pages) == 1 else f"pages {pages[0]}-{pages[-1]}"
+
+
+def format_pdf_tables(tables, max_rows=PROMPT_ROWS, max_tables=MAX_PROMPT_TABLES):
+    """Renders extracted tables as prompt text: name, pages, typed columns and leading rows as CSV."""
+    sections = []
+    for name, table in list(tables.items())[:max_tables]:
+        columns = ", ".join(f"{column} ({dtype})" for column, dtype in table.dtypes.items())
+        shown = "" if len(table) <= max_rows else f", first {max_rows} shown"
+        sections.append(
+            f"Table {name} ({describe_pages(table.attrs['pages'])}, {len(table)} rows{shown}); columns: {columns}\n"
+            + table.head(max_rows).to_csv(index=False)
+        )
+    if len(tables) > max_tables:
+        sections.append(f"({len(tables) - max_tables} more tables not shown)")
+    return "\n".join(sections)
@@ -0,0 +1,134 @@
+"""Dataset profiles used as prompt context for tabular files.
+
+A profile summarises every column of the full DataFrame (types, nulls,
+ranges, quantiles, most common values), the strongest correlations between
+numeric columns, and a small sample stratified over the categorical groups.
+It is computed once per loaded file with column-wise vectorised operations,
+and its size depends on the number of columns, not the number of rows.
+"""
+import numpy as np
+import pandas as pd
+
+TOP_K_VALUES = 5
+SAMPLE_ROWS = 20
+QUANTILES = (0.25, 0.5, 0.75)
+MIN_CORRELATION = 0.3
+MAX_CORRELATIONS = 10
+# Categorical columns with more groups than this are not used for stratification.
+MAX_STRATA_GROUPS = 50
+
+
+def _fmt(value):
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def _dtype_name(dtype):
+    """Returns a short dtype name; Arrow-backed columns get their NumPy-style equivalent."""
+    if not isinstance(dtype, pd.ArrowDtype):
+        return str(dtype)
+    import pyarrow as pa  # Already loaded: Arrow-backed columns come from the frame cache
+    if pa.types.is_dictionary(dtype.pyarrow_dtype):
+        return "category"
+    if pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype):
+        return "str"
+    return str(dtype.numpy_dtype)
+
+
+def _stratified_sample(df, strata, rows):
+    """Returns up to `rows` rows covering every group of the strata columns."""
+    if len(df) <= rows:
+        return df
+    rng = np.random.default_rng(0)
+    if strata:
+        # First row of each group, then random rows to fill the remaining slots.
+        # Combined group codes from per-column factorize are much cheaper than a groupby.
+        groups = np.zeros(len(df), dtype=np.int64)
+        for name in strata:
+            codes, uniques = pd.factorize(df[name], use_na_sentinel=False)
+            groups = groups * len(uniques) + codes
+        picked = np.flatnonzero(~pd.Series(groups).duplicated().to_numpy())[:rows]
+    else:
+        picked = np.empty(0, dtype=np.int64)
+    extra = np.setdiff1d(rng.choice(len(df), size=min(rows * 2, len(df)), replace=False), picked)
+    rng.shuffle(extra)
+    positions = np.sort(np.concatenate([picked, extra[:rows - len(picked)]]))
+    return df.iloc[positions]
+
+
+def profile_dataframe(df, top_k=TOP_K_VALUES, sample_rows=SAMPLE_ROWS):
+    """Computes a compact profile of df. See the module docstring for its contents."""
+    null_counts = df.isna().sum()
+    numeric = df.select_dtypes(include="number").columns.drop(
+        df.select_dtypes(include="bool").columns, errors="ignore"
+    )
+    numeric_stats = df[numeric].agg(["min", "max", "mean", "std"]) if len(numeric) else None
+    numeric_quantiles = df[numeric].quantile(list(QUANTILES)) if len(numeric) else None
+
+    columns = []
+    strata = []
+    for name, series in df.items():
+        column = {"name": name, "dtype": _dtype_name(series.dtype), "nulls": int(null_counts[name])}
+        if name in numeric:
+            column["min"] = numeric_stats.at["min", name]
+            column["max"] = numeric_stats.at["max", name]
+            column["mean"] = numeric_stats.at["mean", name]
+            column["std"] = numeric_stats.at["std", name]
+            column["quantiles"] = [numeric_quantiles.at[q, name] for q in QUANTILES]
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            column["min"] = series.min()
+            column["max"] = series.max()
+        else:
+            counts = series.value_counts(dropna=True)
+            column["distinct"] = len(counts)
+            column["top_values"] = list(zip(counts.index[:top_k].tolist(), counts.iloc[:top_k].tolist()))
+            if 1 < len(counts) <= MAX_STRATA_GROUPS and len(strata) < 2:
+                strata.append(name)
+        columns.append(column)
+
+    correlations = []
+    if len(numeric) > 1:
+        matrix = df[numeric].corr().to_numpy()
+        upper = np.triu_indices_from(matrix, k=1)
+        values = matrix[upper]
+        order = np.argsort(-np.abs(np.nan_to_num(values)))
+        for i in order[:MAX_CORRELATIONS]:
+            if abs(values[i]) >= MIN_CORRELATION:
+                correlations.append((numeric[upper[0][i]], numeric[upper[1][i]], float(values[i])))
+
+    return {
+        "rows": len(df),
+        "columns": columns,
+        "correlations": correlations,
+        "strata": strata,
+        "sample": _stratified_sample(df, strata, sample_rows),
+    }
+
+
+def format_profile(profile, sample=True):
+    """Renders a profile as a compact plain-text prompt section (without the sample rows if not sample)."""
+    lines = [f"Rows: {profile['rows']}, Columns: {len(profile['columns'])}", "Columns:"]
+    for column in profile["columns"]:
+        parts = [f"nulls {column['nulls']}"]
+        if "quantiles" in column:
+            low, median, high = (_fmt(q) for q in column["quantiles"])
+            parts.append(
+                f"min {_fmt(column['min'])}, p25 {low}, median {median}, p75 {high}, max {_fmt(column['max'])}; "
+                f"mean {_fmt(column['mean'])}, std {_fmt(column['std'])}"
+            )
+        elif "top_values" in column:
+            top = ", ".join(f"{_fmt(value)} ({count})" for value, count in column["top_values"])
+            parts.append(f"{column['distinct']} distinct; top: {top}")
+        elif "min" in column:
+            parts.append(f"from {column['min']} to {column['max']}")
+        lines.append(f"- {column['name']} ({column['dtype']}): " + "; ".join(parts))
+    if profile["correlations"]:
+        pairs = ", ".join(f"{a} ~ {b}: {r:+.2f}" for a, b, r in profile["correlations"])
+        lines.append(f"Notable correlations: {pairs}")
+    if not sample:
+        return "\n".join(lines)
+    stratified = f" (stratified by {', '.join(profile['strata'])})" if profile["strata"] else ""
+    lines.append(f"Representative rows{stratified}:")
+    lines.append(profile["sample"].to_csv(index=False).strip())
+    return "\n".join(lines)
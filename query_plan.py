@@ -0,0 +1,225 @@
+"""Structured query plans executed locally over the full DataFrame.
+
+Gemini only ever sees a sample of a tabular file, so any figure it computes
+itself is an estimate. Instead, it is asked for a small JSON query plan
+(filter, group-by, aggregate, sort, top-n) which is run here with vectorised
+pandas operations over every row. Only the small result table is sent back to
+the model; the rows themselves never leave the machine.
+
+Plan format::
+
+    {
+      "filters": [{"column": "Gender", "op": "==", "value": "Female"}],
+      "group_by": ["Experience_Years"],
+      "aggregations": [{"column": "Salary", "func": "mean", "as": "avg_salary"}],
+      "sort": [{"column": "avg_salary", "ascending": false}],
+      "limit": 10
+    }
+
+Every key is optional. Without aggregations the plan returns matching rows.
+"""
+import json
+import operator
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+PLAN_PATTERN = re.compile(r'```json\n(.*?)\n```', re.DOTALL)
+
+AGGREGATIONS = {
+    "sum": "sum",
+    "mean": "mean",
+    "average": "mean",
+    "avg": "mean",
+    "median": "median",
+    "min": "min",
+    "max": "max",
+    "count": "count",
+    "nunique": "nunique",
+    "std": "std",
+}
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+FILTER_OPS = tuple(COMPARISONS) + ("in", "not in", "between", "contains", "is null", "not null")
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+PLAN_INSTRUCTIONS = f"""
+Respond with a JSON query plan that computes the figures needed to answer the question, enclosed in triple backticks and a `json` tag:
+```json
+{{
+  "filters": [{{"column": "column_name", "op": "{'" | "'.join(FILTER_OPS)}", "value": ...}}],
+  "group_by": ["column_name"],
+  "aggregations": [{{"column": "column_name" | "*", "func": "{'" | "'.join(AGGREGATIONS)}", "as": "result_name"}}],
+  "sort": [{{"column": "column_name or result_name", "ascending": true | false}}],
+  "limit": 10
+}}
+```
+All keys are optional. Use "*" with "count" to count rows. For "in"/"not in" the value is a list, and for "between" it is [low, high].
+Without aggregations the plan returns the matching rows. Column names must exactly match the schema.
+If the question cannot be answered by filtering and aggregating the data, respond with ```json
+null
+```
+"""
+
+
+class QueryPlanError(ValueError):
+    """Raised when a query plan is malformed or refers to unknown columns."""
+
+
+def extract_query_plan(response_text):
+    """Returns the query plan dict from a model response, or None if there is none."""
+    match = PLAN_PATTERN.search(response_text)
+    if not match:
+        return None
+    try:
+        plan = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        print("Error decoding query plan JSON from LLM response.")
+        return None
+    return plan if isinstance(plan, dict) and plan else None
+
+
+def _data_errors():
+    """Exception types pandas (and pyarrow, for Arrow-backed columns) raise for operations a column does not support."""
+    errors = (TypeError, ValueError, KeyError, NotImplementedError)
+    pyarrow = sys.modules.get("pyarrow")  # Arrow errors can only occur once pyarrow is loaded
+    return errors + (pyarrow.ArrowException,) if pyarrow is not None else errors
+
+
+def _require_column(df, column):
+    if column not in df.columns:
+        raise QueryPlanError(f"Unknown column '{column}' in query plan.")
+    return df[column]
+
+
+def _coerce(series, value):
+    """Converts a plan literal to the column's type so comparisons stay vectorised."""
+    if isinstance(value, list):
+        return [_coerce(series, item) for item in value]
+    if pd.api.types.is_numeric_dtype(series) and isinstance(value, str):
+        converted = pd.to_numeric(value, errors="coerce")
+        return value if pd.isna(converted) else converted
+    if pd.api.types.is_datetime64_any_dtype(series) and value is not None:
+        return pd.Timestamp(value)
+    return value
+
+
+def _filter_mask(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for condition in filters:
+        series = _require_column(df, condition.get("column"))
+        op = str(condition.get("op", "==")).lower()
+        value = _coerce(series, condition.get("value"))
+        if op in COMPARISONS:
+            result = COMPARISONS[op](series, value)
+        elif op in ("in", "not in"):
+            result = series.isin(value if isinstance(value, list) else [value])
+            if op == "not in":
+                result = ~result
+        elif op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise QueryPlanError("'between' filters need a [low, high] value.")
+            result = series.between(value[0], value[1])
+        elif op == "contains":
+            result = series.astype("string").str.contains(str(value), case=False, regex=False)
+        elif op == "is null":
+            result = series.isna()
+        elif op == "not null":
+            result = series.notna()
+        else:
+            raise QueryPlanError(f"Unsupported filter operator '{op}'.")
+        mask &= result.fillna(False).to_numpy(dtype=bool)
+    return mask
+
+
+def _named_aggregations(df, aggregations):
+    named = {}
+    for spec in aggregations:
+        func = AGGREGATIONS.get(str(spec.get("func", "")).lower())
+        if func is None:
+            raise QueryPlanError(f"Unsupported aggregation '{spec.get('func')}'.")
+        column = spec.get("column") or "*"
+        if column == "*":
+            if func != "count":
+                raise QueryPlanError("Only 'count' can be applied to '*'.")
+            alias = spec.get("as") or "row_count"
+            func = "size"
+            column = df.columns[0]
+        else:
+            _require_column(df, column)
+            alias = spec.get("as") or f"{func}_{column}"
+        named[alias] = (column, func)
+    return named
+
+
+def execute_plan(df, plan, max_rows=MAX_LIMIT):
+    """Runs a query plan over df and returns the (small) result DataFrame.
+
+    Plans that do not fit the data (e.g. a mean over a categorical column, or
+    comparing a number with text) raise QueryPlanError like malformed ones.
+    """
+    try:
+        return _run_plan(df, plan, max_rows)
+    except QueryPlanError:
+        raise
+    except _data_errors() as e:
+        raise QueryPlanError(f"Query plan does not fit the data: {e}") from e
+
+
+def _run_plan(df, plan, max_rows):
+    if not isinstance(plan, dict):
+        raise QueryPlanError("Query plan must be a JSON object.")
+    filters = plan.get("filters") or []
+    group_by = plan.get("group_by") or []
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    for column in group_by:
+        _require_column(df, column)
+    named = _named_aggregations(df, plan.get("aggregations") or [])
+
+    # Only the columns the plan touches are materialised after filtering.
+    needed = list(dict.fromkeys(group_by + [column for column, _ in named.values()]))
+    mask = _filter_mask(df, filters) if filters else None
+    if named:
+        source = df[needed] if mask is None else df.loc[mask, needed]
+        if group_by:
+            result = source.groupby(group_by, observed=True, sort=False, dropna=False).agg(**named).reset_index()
+        else:
+            result = pd.DataFrame(
+                {alias: [len(source) if func == "size" else source[column].agg(func)] for alias, (column, func) in named.items()}
+            )
+    else:
+        result = df if mask is None else df.loc[mask]
+        if group_by:
+            result = result[group_by].drop_duplicates()
+
+    limit = plan.get("limit") or DEFAULT_LIMIT
+    try:
+        limit = max(1, min(int(limit), max_rows))
+    except (TypeError, ValueError):
+        raise QueryPlanError(f"Invalid limit '{limit}'.")
+
+    sort = plan.get("sort") or []
+    if isinstance(sort, dict):
+        sort = [sort]
+    if sort:
+        columns = [spec.get("column") for spec in sort]
+        for column in columns:
+            _require_column(result, column)
+        ascending = [bool(spec.get("ascending", True)) for spec in sort]
+        if len(columns) == 1 and pd.api.types.is_numeric_dtype(result[columns[0]]):
+            # Partial selection avoids sorting millions of rows for a top-n.
+            select = result.nsmallest if ascending[0] else result.nlargest
+            result = select(limit, columns[0])
+        else:
+            result = result.sort_values(columns, ascending=ascending, kind="stable")
+    return result.head(limit).reset_index(drop=True)
@@ -0,0 +1,125 @@
+"""Local lexical retrieval over extracted PDF text.
+
+The document is split into overlapping word windows that never cross a page
+boundary, and a BM25 index is built over them once when the document is
+loaded. Questions are then answered from the top-scoring chunks only, so the
+prompt size no longer grows with the length of the document.
+"""
+import re
+import sys
+from collections import Counter, defaultdict
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was "
+    "were what when where which who why will with you your do does did can me my about".split()
+)
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 40
+TOP_K = 8
+# Documents shorter than this many characters are sent whole; retrieval only
+# pays off once the text would be expensive to send on every question.
+FULL_TEXT_CHAR_LIMIT = 12000
+
+
+def tokenize(text):
+    """Lower-cases text and splits it into index terms, dropping stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_pages(pages, texts, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Splits page texts into overlapping word windows.
+
+    Returns a list of (page_number, chunk_text) tuples in document order.
+    """
+    step = max(chunk_words - overlap, 1)
+    chunks = []
+    for page, text in zip(pages, texts):
+        words = text.split()
+        for start in range(0, max(len(words) - overlap, 1), step):
+            window = words[start:start + chunk_words]
+            if window:
+                chunks.append((page, " ".join(window)))
+    return chunks
+
+
+class BM25Index:
+    """An in-memory Okapi BM25 index over document chunks."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.pages = [page for page, _ in chunks]
+        self.texts = [text for _, text in chunks]
+        self.k1 = k1
+        self.b = b
+
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = np.empty(len(chunks), dtype=np.float32)
+        for doc_id, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                ids, tfs = postings[term]
+                ids.append(doc_id)
+                tfs.append(tf)
+
+        doc_count = len(chunks)
+        average_length = float(doc_lengths.mean()) if doc_count else 0.0
+        # Per-document length normalisation is fixed once the index is built.
+        self._length_norm = k1 * (1 - b + b * doc_lengths / (average_length or 1.0))
+        self._postings = {}
+        for term, (ids, tfs) in postings.items():
+            df = len(ids)
+            idf = np.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            self._postings[term] = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32), idf)
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def nbytes(self):
+        """Estimated heap memory held by the index: chunk texts, postings and length norms."""
+        texts = sum(sys.getsizeof(text) for text in self.texts) + sys.getsizeof(self.texts) + sys.getsizeof(self.pages)
+        postings = sum(
+            sys.getsizeof(term) + sys.getsizeof(ids) + sys.getsizeof(tfs)
+            for term, (ids, tfs, _) in self._postings.items()
+        )
+        return texts + postings + sys.getsizeof(self._postings) + self._length_norm.nbytes
+
+    def top_chunks(self, query, top_k=TOP_K):
+        """Returns the indices of the top_k chunks for a query, best match first."""
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, idf = posting
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[ids])
+
+        matched = np.flatnonzero(scores)
+        if matched.size > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        return matched[np.argsort(-scores[matched], kind="stable")].tolist()
+
+
+def select_chunks(index, question, top_k=TOP_K):
+    """Returns the ids of the top_k chunks for a question, in document order.
+
+    If no chunk matches the question, the opening chunks are used instead.
+    """
+    return sorted(index.top_chunks(question, top_k)) or list(range(min(top_k, len(index))))
+
+
+def format_chunks(index, chunk_ids):
+    """Renders chunks as excerpts labelled with their page numbers."""
+    return "\n\n".join(f"[Page {index.pages[i]}]\n{index.texts[i]}" for i in chunk_ids)
+
+
+def build_pdf_context(index, question, top_k=TOP_K):
+    """Returns the top_k chunks for a question, labelled with page numbers.
+
+    Chunks are kept in document order so the excerpt reads naturally.
+    """
+    return format_chunks(index, select_chunks(index, question, top_k))
@@ -0,0 +1,98 @@
+"""Offline stand-in for the Gemini model.
+
+StubModel implements the parts of genai.GenerativeModel the app uses
+(generate_content, with or without streaming and with a prompt or a list of
+messages, and count_tokens), so the pipeline can be exercised and timed
+without network access or an API key. cache_context stands in for Gemini
+context caching in conversations.
+"""
+import re
+import threading
+import time
+
+QUESTION_PATTERN = re.compile(r'Question: "(.*)"', re.DOTALL)
+
+
+class StubResponse:
+    """Mimics a Gemini response (or streamed chunk) with a .text attribute."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class StubTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+def _text(contents):
+    """Returns the text of a prompt or a list of {"role", "parts"} messages."""
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for message in contents for part in message["parts"])
+
+
+class StubCachedModel:
+    """Mimics a model bound to cached content: the context is used but not sent with each call."""
+
+    def __init__(self, model, context):
+        self.model = model
+        self.context = context
+
+    def generate_content(self, contents, stream=False):
+        return self.model.generate_content(contents, stream=stream, cached_context=self.context)
+
+
+class StubModel:
+    """A deterministic fake model with configurable latency and responses.
+
+    respond, if given, is called with each prompt (for a list of messages,
+    the text of the last one) and returns the response text. By default query-plan prompts get "no plan" and every other prompt
+    gets a one-line answer echoing the question.
+    """
+
+    def __init__(self, latency=0.0, respond=None, chunk_size=40, chunk_latency=0.0):
+        self.latency = latency
+        self.respond = respond or self.default_response
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+        # Characters sent with each call, and characters served from a cached context,
+        # to compare conversation costs.
+        self.sent_chars = 0
+        self.cached_chars = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_response(prompt):
+        if "JSON query plan" in prompt:
+            return "```json\nnull\n```"
+        match = QUESTION_PATTERN.search(prompt)
+        question = match.group(1) if match else "the question"
+        return f"Stub answer to {question}."
+
+    def generate_content(self, contents, stream=False, cached_context=None):
+        """Answers a prompt or a list of messages; respond sees the last message's text."""
+        with self._lock:
+            self.calls += 1
+            self.sent_chars += len(_text(contents))
+            self.cached_chars += len(cached_context or "")
+        time.sleep(self.latency)
+        text = self.respond(contents if isinstance(contents, str) else _text(contents[-1:]))
+        if not stream:
+            return StubResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        for start in range(0, len(text), self.chunk_size):
+            if self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield StubResponse(text[start:start + self.chunk_size])
+
+    def cache_context(self, context):
+        """Returns a model bound to context, like genai.GenerativeModel.from_cached_content."""
+        return StubCachedModel(self, context)
+
+    def count_tokens(self, contents):
+        # Roughly four characters per token, like Gemini's English tokenizer.
+        return StubTokenCount(len(str(contents)) // 4)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import ChartSpecError, build_chart, lttb_indices
+from ingest import load_table
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    rows = 10000
+    return pd.DataFrame({
+        "department": rng.choice(["Sales", "Engineering", "HR"], rows),
+        "salary": rng.normal(60000, 15000, rows),
+        "hired": (pd.Timestamp("2000-01-01") + pd.to_timedelta(rng.integers(0, 9000, rows), unit="D")).astype("datetime64[us]"),
+    })
+
+
+def test_lttb_keeps_endpoints_and_budget():
+    x = np.arange(1000, dtype=float)
+    keep = lttb_indices(x, np.sin(x / 50), 100)
+    assert len(keep) == 100 and keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_bar_chart_is_aggregated(df):
+    chart, note = build_chart(df, {"chart_type": "bar", "x_column": "department", "y_column": "salary", "aggregation": "average"})
+    assert len(chart.data) == 3 and note is None
+
+
+def test_line_chart_is_downsampled(df):
+    chart, note = build_chart(df, {"chart_type": "line", "x_column": "hired", "y_column": "salary"}, max_points=500)
+    assert len(chart.data) == 500 and "LTTB" in note
+
+
+@pytest.mark.parametrize("unit", ["s", "us", "ns"])
+def test_binned_scatter_keeps_datetime_range(df, unit):
+    df["hired"] = df["hired"].astype(f"datetime64[{unit}]")
+    chart, note = build_chart(df, {"chart_type": "scatter", "x_column": "hired", "y_column": "salary"}, max_points=400)
+    assert "density" in note
+    hired = chart.data["hired"]
+    assert hired.min() >= pd.Timestamp("2000-01-01") and hired.max() <= pd.Timestamp("2025-01-01")
+
+
+@pytest.mark.parametrize("chart_type", ["bar", "line", "scatter", "histogram"])
+def test_charts_on_a_cached_frame(df, tmp_path, chart_type):
+    # The app charts the frame mapped back from the frame cache, with ISO dates parsed from CSV.
+    csv = df.assign(hired=df["hired"].dt.strftime("%Y-%m-%d")).to_csv(index=False).encode()
+    load_table(csv, ".csv", "digest", str(tmp_path))
+    cached = load_table(csv, ".csv", "digest", str(tmp_path))
+    x_column = {"bar": "department", "histogram": "salary"}.get(chart_type, "hired")
+    chart, _ = build_chart(cached, {"chart_type": chart_type, "x_column": x_column, "y_column": "salary"}, max_points=400)
+    chart.to_dict()
+    if x_column == "hired":
+        assert chart.data["hired"].min() >= pd.Timestamp("2000-01-01")
+
+
+def test_unknown_column(df):
+    with pytest.raises(ChartSpecError):
+        build_chart(df, {"chart_type": "bar", "x_column": "region"})
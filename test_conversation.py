@@ -0,0 +1,187 @@
+import pandas as pd
+import pytest
+
+from conversation import DocumentConversation, gemini_context_cache
+from insight import (
+    build_conversation_context,
+    build_conversation_plan_prompt,
+    build_followup_context,
+    build_insight_prompt,
+    build_plan_prompt,
+    build_turn_prompt,
+    new_pdf_excerpts,
+    pdf_context_chunks,
+    run_query_plan,
+)
+from profiling import format_profile, profile_dataframe
+from retrieval import BM25Index, chunk_pages, select_chunks
+from stub_model import StubModel
+
+QUESTIONS = ["What is the average salary?", "Now break that down by gender.", "Which group earns the most?"]
+
+
+@pytest.fixture
+def df():
+    rows = 3000
+    return pd.DataFrame({
+        "Gender": pd.Categorical(["Female", "Male", "Other"] * (rows // 3)),
+        "Department": [f"Department {i % 40}" for i in range(rows)],
+        "Salary": [40000.0 + 7 * i for i in range(rows)],
+        # Typical exports carry many more columns, each widening the profile's sample rows.
+        **{f"Metric_{j}": [float((i * (j + 3)) % 997) for i in range(rows)] for j in range(12)},
+    })
+
+
+@pytest.fixture
+def profile_text(df):
+    return format_profile(profile_dataframe(df))
+
+
+@pytest.fixture
+def followup_context(df):
+    return build_followup_context(".csv", format_profile(profile_dataframe(df), sample=False))
+
+
+def cache_with_stub(model, context):
+    return model.cache_context(context)
+
+
+def run_conversation(conversation, model, profile_text, followup_context=None):
+    """Asks every question in turn and returns the characters sent per answer call."""
+    conversation.start(build_conversation_context(profile_text, "profile of the full dataset", ".csv"), (), followup_context)
+    sent = []
+    for question in QUESTIONS:
+        before = model.sent_chars
+        message = build_turn_prompt(question)
+        answer = conversation.send(model, message).text
+        sent.append(model.sent_chars - before)
+        conversation.record(question, message, answer)
+    return sent
+
+
+def stateless_chars(profile_text, question):
+    return len(build_insight_prompt(profile_text, "profile of the full dataset", question, ".csv"))
+
+
+def test_cached_context_is_not_resent(profile_text):
+    model = StubModel()
+    conversation = DocumentConversation(cache_context=cache_with_stub)
+    sent = run_conversation(conversation, model, profile_text)
+    assert conversation.cached_model is not None
+    assert all(chars < len(conversation.context) for chars in sent)
+    assert model.cached_chars == 3 * len(conversation.context)
+    # Follow-ups carry the short history and the question, far less than a fresh question.
+    assert sent[1] < stateless_chars(profile_text, QUESTIONS[1]) / 4
+
+
+def test_without_cache_follow_ups_send_the_outline(profile_text, followup_context):
+    model = StubModel()
+    conversation = DocumentConversation()
+    sent = run_conversation(conversation, model, profile_text, followup_context)
+    assert model.cached_chars == 0
+    assert sent[0] >= len(conversation.context)
+    # Follow-ups send the outline, history and question, less than a fresh question (which carries the sample rows).
+    assert all(chars < 0.8 * stateless_chars(profile_text, question) for chars, question in zip(sent[1:], QUESTIONS[1:]))
+    history_chars = sum(len(turn["message"]) + len(turn["answer"]) for turn in conversation.turns[:2])
+    assert sent[2] <= len(followup_context) + len(build_turn_prompt(QUESTIONS[2])) + history_chars + 10
+
+
+def test_uncached_pdf_follow_ups_bring_their_own_excerpts():
+    pages = [f"Page {page} covers the {topic} budget in detail." for page, topic in enumerate(["travel", "hiring", "office"], 1)]
+    document = pd.DataFrame({"page": [1, 2, 3], "text_content": pages})
+    index = BM25Index(chunk_pages(document["page"], document["text_content"], chunk_words=8, overlap=0))
+    conversation = DocumentConversation()
+    conversation.start("full text", pdf_context_chunks(document, "travel", index), build_followup_context(".pdf"))
+    assert conversation.sent_chunks() == {0, 1, 2}  # A short document is sent whole with the first question
+    conversation.record("travel?", build_turn_prompt("travel?"), "Travel is on page 1.")
+    excerpts, chunks = new_pdf_excerpts("What about hiring?", index, conversation.sent_chunks())
+    assert "[Page 2]" in excerpts and len(chunks) <= 4
+    conversation.record("hiring?", build_turn_prompt("hiring?", excerpts), "Hiring is on page 2.", chunks)
+    assert new_pdf_excerpts("And hiring again?", index, conversation.sent_chunks())[1] == [
+        chunk for chunk in select_chunks(index, "And hiring again?") if chunk not in chunks
+    ][:4]
+    assert "full text" not in conversation.contents("next")[0]["parts"][0]
+
+
+def test_caching_failure_falls_back_to_sending_the_context(profile_text):
+    def failing_cache(model, context):
+        raise RuntimeError("model does not support caching")
+
+    model = StubModel()
+    conversation = DocumentConversation(cache_context=failing_cache)
+    run_conversation(conversation, model, profile_text)
+    assert model.calls == 3 and model.cached_chars == 0
+    assert model.sent_chars > 3 * len(conversation.context)
+
+
+def test_expired_cache_is_recreated(profile_text):
+    created = []
+
+    def cache(model, context):
+        created.append(context)
+        return model.cache_context(context)
+
+    model = StubModel()
+    conversation = DocumentConversation(cache_context=cache)
+    conversation.start(build_conversation_context(profile_text, "profile", ".csv"))
+    conversation.send(model, build_turn_prompt(QUESTIONS[0]))
+    conversation.cached_model.generate_content = None  # Calling it now fails, like an expired cache
+    assert "Stub answer" in conversation.send(model, build_turn_prompt(QUESTIONS[1])).text
+    conversation.send(model, build_turn_prompt(QUESTIONS[2]))
+    assert len(created) == 2
+
+
+def test_history_is_trimmed_to_the_token_budget(profile_text):
+    conversation = DocumentConversation(token_budget=50)
+    conversation.start("context")
+    for i in range(5):
+        conversation.record(f"q{i}", "m" * 80, "a" * 40, chunks=[i])
+    kept = conversation.kept_turns()
+    assert [turn["question"] for turn in kept] == ["q4"]
+    assert conversation.history_tokens() <= 50
+    assert conversation.sent_chunks() == {4}
+
+
+def test_streamed_follow_up(profile_text):
+    model = StubModel(chunk_size=5)
+    conversation = DocumentConversation(cache_context=cache_with_stub)
+    conversation.start(build_conversation_context(profile_text, "profile", ".csv"))
+    chunks = list(conversation.send(model, build_turn_prompt(QUESTIONS[0]), stream=True))
+    assert "".join(chunk.text for chunk in chunks) == f"Stub answer to {QUESTIONS[0]}."
+
+
+def test_plan_requests_use_the_cached_profile(df, profile_text):
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt)
+        if "JSON query plan" in prompt:
+            return '```json\n{"group_by": ["Gender"], "aggregations": [{"column": "Salary", "func": "mean"}]}\n```'
+        return "ok"
+
+    model = StubModel(respond=respond)
+    conversation = DocumentConversation(cache_context=cache_with_stub)
+    conversation.start(build_conversation_context(profile_text, "profile", ".csv"))
+    conversation.record(QUESTIONS[0], build_turn_prompt(QUESTIONS[0]), "ok")
+    plan_prompt = build_conversation_plan_prompt(QUESTIONS[1], [QUESTIONS[0]])
+    before = model.sent_chars
+    plan, result = run_query_plan(
+        df, QUESTIONS[1], profile_text,
+        lambda prompt, payload: conversation.send(model, prompt, with_history=False).text,
+        plan_prompt,
+    )
+    assert result["Gender"].tolist() == ["Female", "Male", "Other"]
+    assert profile_text not in prompts[-1] and QUESTIONS[0] in prompts[-1]
+    assert model.sent_chars - before == len(plan_prompt)
+
+
+def test_uncached_follow_up_plans_use_the_profile_summary(df, profile_text):
+    summary = format_profile(profile_dataframe(df), sample=False)
+    prompt = build_plan_prompt(summary, QUESTIONS[1], [QUESTIONS[0]])
+    assert QUESTIONS[0] in prompt and "Representative rows" not in prompt
+    assert len(prompt) < len(build_plan_prompt(profile_text, QUESTIONS[1]))
+
+
+def test_small_contexts_are_not_sent_to_gemini_caching():
+    with pytest.raises(ValueError):
+        gemini_context_cache(StubModel(), "a short profile")
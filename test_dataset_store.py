@@ -0,0 +1,98 @@
+import io
+
+import pandas as pd
+import pytest
+
+from dataset_store import DatasetStore, frame_bytes, value_bytes
+from ingest import load_table
+from insight import build_document_state
+
+
+@pytest.fixture
+def csv_bytes():
+    rows = 5000
+    return pd.DataFrame({
+        "department": ["Sales", "Engineering", "HR", "Finance", "Operations"] * (rows // 5),
+        "salary": [float(i) for i in range(rows)],
+        "hired": pd.date_range("2000-01-01", periods=rows, freq="D").strftime("%Y-%m-%d"),
+    }).to_csv(index=False).encode()
+
+
+def test_cached_tables_are_mapped_arrow_frames(tmp_path, csv_bytes):
+    cold = load_table(csv_bytes, ".csv", "digest", str(tmp_path))
+    warm = load_table(csv_bytes, ".csv", "digest", str(tmp_path))
+    assert isinstance(warm["department"].dtype, pd.CategoricalDtype)
+    assert str(warm["salary"].dtype) == "double[pyarrow]"
+    assert str(warm["hired"].dtype) == "timestamp[us][pyarrow]"
+    assert list(cold.dtypes.astype(str)) == list(warm.dtypes.astype(str))
+    assert frame_bytes(warm) < frame_bytes(pd.DataFrame(warm.to_dict(orient="list")))
+
+
+def test_frame_bytes_counts_heap_columns():
+    df = pd.DataFrame({"a": range(1000)}, dtype="int64")
+    assert frame_bytes(df) == df.memory_usage(index=True, deep=True).sum()
+    assert frame_bytes(df.astype("int64[pyarrow]")) == df.memory_usage(index=True).iloc[0]
+
+
+def test_store_shares_and_reloads_evicted_frames(tmp_path, csv_bytes):
+    store = DatasetStore(str(tmp_path), max_bytes=0)
+    loader_calls = []
+
+    def loader(digest):
+        def parse():
+            loader_calls.append(digest)
+            return pd.read_csv(io.BytesIO(csv_bytes)).assign(copy=digest)
+        return parse
+
+    first = store.load("a", ".csv", loader("a"))
+    assert store.load("a", ".csv", loader("a")).frame() is first.frame()
+    store.load("b", ".csv", loader("b"))
+    assert store.stats()["evictions"] == 1
+    assert first.frame()["copy"].iloc[0] == "a"
+    assert loader_calls == ["a", "b"]
+    assert store.stats()["reloads"] == 1
+
+
+def test_derived_state_is_charged_and_evicted(tmp_path, csv_bytes):
+    pages = 300
+    pdf = pd.DataFrame({
+        "page": range(1, pages + 1),
+        "text_content": [f"Page {page} reviews the budget of region {page % 7} in detail. " * 60 for page in range(1, pages + 1)],
+    })
+    store = DatasetStore(str(tmp_path), max_bytes=1024 ** 2)
+
+    def document_state(handle):
+        return handle.derived("document_state", lambda df: build_document_state(df, handle.extension))
+
+    pdf_handle = store.load("pdf", ".pdf", lambda: pdf)
+    index = document_state(pdf_handle)["pdf_index"]
+    # The index holds its own copy of the text, which the mapped frame does not.
+    assert value_bytes(index) > pdf["text_content"].str.len().sum()
+    assert store.stats()["bytes"] >= value_bytes(index)
+
+    for digest in "abcd":
+        handle = store.load(digest, ".csv", lambda: pd.read_csv(io.BytesIO(csv_bytes)))
+        assert document_state(handle)["profile_text"]
+    stats = store.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 4
+    assert 0 < stats["bytes"] <= store.max_bytes
+    # The evicted index is rebuilt from the frame mapped back from disk.
+    assert document_state(pdf_handle)["pdf_index"] is not index
+
+
+def test_unspillable_frames_only_lose_derived_state(tmp_path):
+    store = DatasetStore(str(tmp_path), max_bytes=0)
+    handle = store.load("a", ".csv", lambda: pd.DataFrame({"a": [1, 2]}))
+    (tmp_path / "a.feather").unlink()  # As if the frame cache could not be written
+    computed = []
+
+    def factory(df):
+        computed.append(len(df))
+        return "x" * 1000
+
+    handle.derived("state", factory)
+    store.load("b", ".csv", lambda: pd.DataFrame({"b": [1, 2]}))
+    stats = store.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] < 1000
+    handle.derived("state", factory)
+    assert computed == [2, 2]
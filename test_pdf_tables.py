@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from pdf_tables import build_pdf_tables, infer_column_type, stitch_tables
+
+HEADER = ["Region", "Revenue"]
+
+
+def raw(rows, top=0.05, bottom=0.95):
+    return {"rows": rows, "top": top, "bottom": bottom}
+
+
+def test_table_continuing_over_a_page_break_is_stitched_without_its_repeated_header():
+    tables = stitch_tables([1, 2], [
+        [raw([HEADER, ["North", "100"], ["South", "200"]], top=0.5)],
+        [raw([HEADER, ["East", "300"]], bottom=0.4)],
+    ])
+    assert len(tables) == 1
+    assert tables[0]["pages"] == [1, 2]
+    assert tables[0]["rows"] == [HEADER, ["North", "100"], ["South", "200"], ["East", "300"]]
+
+
+def test_continuation_without_a_repeated_header_keeps_all_its_rows():
+    tables = stitch_tables([1, 2, 3], [
+        [raw([HEADER, ["North", "100"]])],
+        [raw([["South", "200"]])],
+        [raw([["East", "300"]], bottom=0.5)],
+    ])
+    assert [table["pages"] for table in tables] == [[1, 2, 3]]
+    assert tables[0]["rows"][1:] == [["North", "100"], ["South", "200"], ["East", "300"]]
+
+
+@pytest.mark.parametrize("first, second", [
+    (raw([HEADER, ["North", "100"]], bottom=0.6), raw([HEADER, ["East", "300"]])),  # Ends mid-page
+    (raw([HEADER, ["North", "100"]]), raw([HEADER, ["East", "300"]], top=0.5)),  # Starts mid-page
+    (raw([HEADER, ["North", "100"]]), raw([["Region", "Revenue", "Margin"], ["East", "300", "5"]])),  # Other columns
+])
+def test_separate_tables_are_not_stitched(first, second):
+    assert [table["pages"] for table in stitch_tables([1, 2], [[first], [second]])] == [[1], [2]]
+
+
+def test_only_the_first_table_on_a_page_can_continue_and_pages_must_be_consecutive():
+    tables = stitch_tables([1, 2, 4], [
+        [raw([HEADER, ["North", "100"]])],
+        [raw([["Title", "Note"]], top=0.5, bottom=0.6), raw([HEADER, ["East", "300"]])],
+        [raw([HEADER, ["West", "400"]])],
+    ])
+    assert [table["pages"] for table in tables] == [[1], [2], [2], [4]]
+
+
+def test_currency_separators_percentages_and_accounting_negatives_parse_as_numbers():
+    values = pd.Series(["$1,200.50", "(300)", "($2,000)", "€ 45", "12%", "-7", ""], dtype=object)
+    result = infer_column_type(values)
+    assert result.iloc[:6].tolist() == [1200.5, -300.0, -2000.0, 45.0, 12.0, -7.0]
+    assert pd.isna(result.iloc[6])
+
+
+def test_dates_parse_and_mostly_text_columns_stay_text():
+    dates = infer_column_type(pd.Series(["2024-01-31", "2024-02-29", "March 31, 2024"], dtype=object))
+    assert pd.api.types.is_datetime64_any_dtype(dates)
+    assert dates.dt.month.tolist() == [1, 2, 3]
+    mixed = pd.Series(["100", "200", "n/a", "pending", "300"], dtype=object)
+    assert infer_column_type(mixed).tolist() == mixed.tolist()
+
+
+def test_build_pdf_tables_names_and_types_stitched_tables():
+    document = pd.DataFrame({
+        "page": [1, 2],
+        "tables": [
+            [raw([HEADER, ["North", "$1,000"]])],
+            [raw([HEADER, ["South", "(250)"]], bottom=0.5), raw([["Only a header", ""]], top=0.6)],
+        ],
+    })
+    tables = build_pdf_tables(document)
+    assert list(tables) == ["table_1"]  # A header without data rows is not a table
+    table = tables["table_1"]
+    assert table.attrs["pages"] == [1, 2]
+    assert table["Region"].tolist() == ["North", "South"]
+    assert table["Revenue"].tolist() == [1000.0, -250.0]
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from ingest import load_table
+from query_plan import QueryPlanError, execute_plan, extract_query_plan
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Gender": pd.Categorical(["Female", "Male", "Female", "Male", "Female"]),
+        "Experience_Years": [1, 5, 3, 8, 5],
+        "Salary": [40000.0, 65000.0, 52000.0, 90000.0, np.nan],
+        "Hired": pd.to_datetime(["2020-01-01", "2018-06-01", "2021-03-15", "2015-09-30", "2019-11-11"]),
+    })
+
+
+def test_extract_query_plan():
+    assert extract_query_plan('```json\n{"limit": 3}\n```') == {"limit": 3}
+    assert extract_query_plan("```json\nnull\n```") is None
+    assert extract_query_plan("no plan here") is None
+
+
+def test_aggregation_without_group_by(df):
+    result = execute_plan(df, {"aggregations": [
+        {"column": "Salary", "func": "average", "as": "avg_salary"},
+        {"column": "*", "func": "count"},
+    ]})
+    assert result.to_dict(orient="records") == [{"avg_salary": 61750.0, "row_count": 5}]
+
+
+def test_filter_group_by_and_sort(df):
+    result = execute_plan(df, {
+        "filters": [{"column": "Experience_Years", "op": ">=", "value": "3"}],
+        "group_by": ["Gender"],
+        "aggregations": [{"column": "Salary", "func": "max", "as": "top"}],
+        "sort": [{"column": "top", "ascending": False}],
+    })
+    assert result["Gender"].tolist() == ["Male", "Female"]
+    assert result["top"].tolist() == [90000.0, 52000.0]
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ({"op": "in", "value": ["Male"]}, 2),
+    ({"op": "not in", "value": "Male"}, 3),
+    ({"op": "contains", "value": "fem"}, 3),
+])
+def test_gender_filters(df, condition, expected):
+    plan = {"filters": [{"column": "Gender", **condition}], "aggregations": [{"column": "*", "func": "count"}]}
+    assert execute_plan(df, plan)["row_count"].item() == expected
+
+
+def test_between_dates_and_null_filters(df):
+    result = execute_plan(df, {"filters": [
+        {"column": "Hired", "op": "between", "value": ["2019-01-01", "2021-12-31"]},
+        {"column": "Salary", "op": "not null"},
+    ]})
+    assert result["Salary"].tolist() == [40000.0, 52000.0]
+
+
+def test_rows_top_n(df):
+    result = execute_plan(df, {"sort": [{"column": "Salary", "ascending": False}], "limit": 2})
+    assert result["Salary"].tolist() == [90000.0, 65000.0]
+
+
+@pytest.fixture
+def cached_df(df, tmp_path):
+    # What the app queries: the frame mapped back from the frame cache.
+    csv = df.assign(Hired=df["Hired"].dt.strftime("%Y-%m-%d")).to_csv(index=False).encode()
+    load_table(csv, ".csv", "digest", str(tmp_path))
+    return load_table(csv, ".csv", "digest", str(tmp_path))
+
+
+def test_cached_frame_sort_by_category_and_filter_by_date(cached_df):
+    result = execute_plan(cached_df, {
+        "filters": [{"column": "Hired", "op": ">", "value": "2016-01-01"}],
+        "sort": [{"column": "Gender", "ascending": False}, {"column": "Salary"}],
+    })
+    assert result["Gender"].tolist() == ["Male", "Female", "Female", "Female"]
+    assert result["Salary"].tolist()[1] == 40000.0
+
+
+def test_cached_frame_group_by_category(cached_df, df):
+    plan = {
+        "filters": [{"column": "Hired", "op": "between", "value": ["2015-01-01", "2020-12-31"]}],
+        "group_by": ["Gender"],
+        "aggregations": [{"column": "*", "func": "count"}],
+        "sort": [{"column": "Gender"}],
+    }
+    result = execute_plan(cached_df, plan)
+    assert result.to_dict(orient="records") == execute_plan(df, plan).to_dict(orient="records")
+
+
+def test_arrow_errors_become_query_plan_errors():
+    # pyarrow raises ArrowNotImplementedError (a NotImplementedError) for e.g. sorting dictionary columns.
+    arrow = pa.table({"Gender": pa.array(["Female", "Male"]).dictionary_encode()}).to_pandas(types_mapper=pd.ArrowDtype)
+    with pytest.raises(QueryPlanError):
+        execute_plan(arrow, {"sort": [{"column": "Gender"}]})
+
+
+@pytest.mark.parametrize("plan", [
+    ["not", "a", "dict"],
+    {"group_by": ["Department"]},
+    {"aggregations": [{"column": "Salary", "func": "mode"}]},
+    {"aggregations": [{"column": "*", "func": "sum"}]},
+    {"filters": [{"column": "Salary", "op": "between", "value": 5}]},
+    {"filters": [{"column": "Salary", "op": "like", "value": 5}]},
+    {"limit": "ten"},
+])
+def test_malformed_plans(df, plan):
+    with pytest.raises(QueryPlanError):
+        execute_plan(df, plan)
+
+
+@pytest.mark.parametrize("plan", [
+    {"aggregations": [{"column": "Gender", "func": "mean"}]},
+    {"filters": [{"column": "Gender", "op": ">", "value": "Female"}]},
+    {"filters": [{"column": "Salary", "op": ">", "value": "high"}]},
+])
+def test_plans_that_do_not_fit_the_data(df, plan):
+    with pytest.raises(QueryPlanError):
+        execute_plan(df, plan)
@@ -0,0 +1,83 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, make_cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+def test_hits_and_misses_are_counted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    assert cache.get("key") is None
+    cache.set("key", "answer")
+    assert cache.get("key") == "answer"
+    assert cache.get("key") == "answer"
+    assert cache.get("other") is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "entries": 1, "bytes": len("answer")}
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), ttl_seconds=60)
+    cache.set("key", "answer")
+    clock.advance(59)
+    assert cache.get("key") == "answer"
+    clock.advance(2)  # Reading an entry does not extend its lifetime
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entries_are_dropped_when_storing(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), ttl_seconds=60)
+    cache.set("old", "answer")
+    clock.advance(61)
+    cache.set("new", "answer")
+    assert cache.stats()["entries"] == 1
+    assert cache.get("new") == "answer"
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_limit(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_bytes=25)
+    for key in ("a", "b"):
+        cache.set(key, "x" * 10)
+        clock.advance(1)
+    assert cache.get("a") == "x" * 10  # "a" is now more recently used than "b"
+    clock.advance(1)
+    cache.set("c", "x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == "x" * 10
+    assert cache.stats()["bytes"] == 20
+
+
+def test_entries_survive_a_restart(tmp_path, clock):
+    path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(path).set("key", "answer")
+    assert ResponseCache(path).get("key") == "answer"
+
+
+def test_cache_key_depends_on_everything_that_shapes_the_answer():
+    key = make_cache_key("file", "1", "payload", "question", "model")
+    assert make_cache_key("file", "1", "payload", "  question ", "model") == key
+    for changed in (
+        ("other", "1", "payload", "question", "model"),
+        ("file", "2", "payload", "question", "model"),
+        ("file", "1", "other", "question", "model"),
+        ("file", "1", "payload", "other", "model"),
+        ("file", "1", "payload", "question", "other"),
+    ):
+        assert make_cache_key(*changed) != key